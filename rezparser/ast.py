@@ -4,6 +4,8 @@ import typing
 class Node(object):
 	"""Base class of all AST nodes. Provides a convenient __init__ and __repr__."""
 	
+	__slots__ = ()
+	
 	def __init__(self, **kwargs):
 		"""Create a node and set all keyword arguments as attributes."""
 		
@@ -33,23 +35,34 @@ class Node(object):
 
 class ResourceValue(Node):
 	"""Base class of all resource values, i. e. anything that can appear as a field value within a resource statement."""
+	
+	__slots__ = ()
 
 class Symbol(ResourceValue):
 	"""A symbol use whose type is not known."""
 	
+	__slots__ = ("name",)
+	
 	name: str
 
 class Expression(ResourceValue):
 	"""Base class of all "simple" expressions (ints or strings)."""
+	
+	__slots__ = ()
 
 class IntExpression(Expression):
 	"""Base class of all int expressions."""
+	
+	__slots__ = ()
 
 class IntLiteral(IntExpression):
 	"""An int literal, including numeric literals of any base, and character literals.
 	The boolean "literals" true and false are standard macros defined to 1 and 0, so they are also considered int literals.
+	The parser may reuse the same IntLiteral object for multiple literals with the same value, so IntLiterals should not be modified.
 	"""
 	
+	__slots__ = ("value",)
+	
 	value: int
 
 class ResourceAttribute(IntExpression):
@@ -57,6 +70,8 @@ class ResourceAttribute(IntExpression):
 	May appear in a ResourceSpecDef, or standalone as an IntExpression.
 	"""
 	
+	__slots__ = ("value",)
+	
 	class Value(enum.Enum):
 		none = 0
 		compressed = 1
@@ -78,29 +93,41 @@ class ResourceAttribute(IntExpression):
 
 class IntSymbol(IntExpression, Symbol):
 	"""A symbol use that is known to be an int, based on its context."""
+	
+	__slots__ = ()
 
 class LabelSubscript(IntExpression):
 	"""A label with one or more subscripts, as used with labels defined inside one or more arrays.
 	Note that a label without any subscripts is represented as an IntSymbol, and not as a LabelSubscript.
 	"""
 	
+	__slots__ = ("name", "subscripts")
+	
 	name: str
 	subscripts: typing.Sequence[IntExpression]
 
 class IntFunction(IntExpression):
 	"""Base class for all Rez functions that return an int."""
+	
+	__slots__ = ()
 
 class FunArrayIndex(IntFunction):
 	"""An $$ArrayIndex(array_name) function call."""
 	
+	__slots__ = ("array_name",)
+	
 	array_name: str
 
 class FunAttributes(IntFunction):
 	"""An $$Attributes function call."""
+	
+	__slots__ = ()
 
 class FunBitField(IntFunction):
 	"""A $$BitField(start, offset, length) function call."""
 	
+	__slots__ = ("start", "offset", "length")
+	
 	start: int
 	offset: int
 	length: int
@@ -108,175 +135,271 @@ class FunBitField(IntFunction):
 class FunByte(IntFunction):
 	"""A $$Byte(start) function call."""
 	
+	__slots__ = ("start",)
+	
 	start: int
 
 class FunCountOf(IntFunction):
 	"""A $$CountOf(array_name) function call."""
 	
+	__slots__ = ("array_name",)
+	
 	array_name: str
 
 class FunDay(IntFunction):
 	"""A $$Day function call."""
+	
+	__slots__ = ()
 
 class FunHour(IntFunction):
 	"""A $$Hour function call."""
+	
+	__slots__ = ()
 
 class FunID(IntFunction):
 	"""An $$ID function call."""
+	
+	__slots__ = ()
 
 class FunLong(IntFunction):
 	"""A $$Long(start) function call."""
 	
+	__slots__ = ("start",)
+	
 	start: int
 
 class FunMinute(IntFunction):
 	"""A $$Minute function call."""
+	
+	__slots__ = ()
 
 class FunMonth(IntFunction):
 	"""A $$Month function call."""
+	
+	__slots__ = ()
 
 class FunPackedSize(IntFunction):
 	"""A $$PackedSize(start, row_bytes, row_count) function call."""
 	
+	__slots__ = ("start", "row_bytes", "row_count")
+	
 	start: int
 	row_bytes: int
 	row_count: int
 
 class FunResourceSize(IntFunction):
 	"""A $$ResourceSize function call."""
+	
+	__slots__ = ()
 
 class FunSecond(IntFunction):
 	"""A $$Second function call."""
+	
+	__slots__ = ()
 
 class FunType(IntFunction):
 	"""A $$Type function call."""
+	
+	__slots__ = ()
 
 class FunWeekday(IntFunction):
 	"""A $$Weekday function call."""
+	
+	__slots__ = ()
 
 class FunWord(IntFunction):
 	"""A $$Word(start) function call."""
 	
+	__slots__ = ("start",)
+	
 	start: int
 
 class FunYear(IntFunction):
 	"""A $$Year function call."""
+	
+	__slots__ = ()
 
 class IntUnaryOp(IntExpression):
 	"""Base class for all unary int operators."""
 	
+	__slots__ = ("value",)
+	
 	value: IntExpression
 
 class Negative(IntUnaryOp):
 	"""A negation (-value)."""
+	
+	__slots__ = ()
 
 class BoolNot(IntUnaryOp):
 	"""A boolean not operation (!value)."""
+	
+	__slots__ = ()
 
 class BitNot(IntUnaryOp):
 	"""A bitwise not operation (~value)."""
+	
+	__slots__ = ()
 
 class IntBinaryOp(IntExpression):
 	"""Base class for all binary int operators."""
 	
+	__slots__ = ("left", "right")
+	
 	left: IntExpression
 	right: IntExpression
 
 class Multiply(IntBinaryOp):
 	"""A multiplication (left * right)."""
+	
+	__slots__ = ()
 
 class Divide(IntBinaryOp):
 	"""A division (left / right)."""
+	
+	__slots__ = ()
 
 class Modulo(IntBinaryOp):
 	"""A modulo operation (left % right)."""
+	
+	__slots__ = ()
 
 class Add(IntBinaryOp):
 	"""An addition (left + right)."""
+	
+	__slots__ = ()
 
 class Subtract(IntBinaryOp):
 	"""A subtraction (left - right)."""
+	
+	__slots__ = ()
 
 class BitShiftLeft(IntBinaryOp):
 	"""A left bit shift (left << right)."""
+	
+	__slots__ = ()
 
 class BitShiftRight(IntBinaryOp):
 	"""A right bit shift (left >> right)."""
+	
+	__slots__ = ()
 
 class LessThan(IntBinaryOp):
 	"""A less than comparison (left < right)."""
+	
+	__slots__ = ()
 
 class GreaterThan(IntBinaryOp):
 	"""A greater than comparison (left > right)."""
+	
+	__slots__ = ()
 
 class LessThanEqual(IntBinaryOp):
 	"""A less than or equal comparison (left <= right)."""
+	
+	__slots__ = ()
 
 class GreaterThanEqual(IntBinaryOp):
 	"""A greater than or equal comparison (left >= right)."""
+	
+	__slots__ = ()
 
 class Equal(IntBinaryOp):
 	"""An equality comparison (left == right)."""
+	
+	__slots__ = ()
 
 class NotEqual(IntBinaryOp):
 	"""An inequality comparison (left != right)."""
+	
+	__slots__ = ()
 
 class BitAnd(IntBinaryOp):
 	"""A bitwise and operation (left & right)."""
+	
+	__slots__ = ()
 
 class BitXor(IntBinaryOp):
 	"""A bitwise exclusive or operation (left ^ right)."""
+	
+	__slots__ = ()
 
 class BitOr(IntBinaryOp):
 	"""A bitwise or operation (left | right)."""
+	
+	__slots__ = ()
 
 class BoolAnd(IntBinaryOp):
 	"""A boolean and operation (left && right)."""
+	
+	__slots__ = ()
 
 class BoolOr(IntBinaryOp):
 	"""A boolean or operation (left || right)."""
+	
+	__slots__ = ()
 
 class StringExpression(Expression):
 	"""Base class for all string expressions."""
+	
+	__slots__ = ()
 
 class StringLiteral(StringExpression):
 	"""A string literal, in text or hexadecimal form.
 	Note that adjacent string literals are not joined automatically, they are instead represented as a StringConcat operation.
 	"""
 	
+	__slots__ = ("value",)
+	
 	value: bytes
 
 class StringSymbol(StringExpression, Symbol):
 	"""A symbol use that is known to be a string, based on its context."""
+	
+	__slots__ = ()
 
 class StringConcat(StringExpression):
 	"""A concatenation of multiple string expressions."""
 	
+	__slots__ = ("values",)
+	
 	values: typing.Sequence[StringExpression]
 
 class StringFunction(StringExpression):
 	"""Base class for all Rez functions that return a string."""
+	
+	__slots__ = ()
 
 class FunDate(StringFunction):
 	"""A $$Date function call."""
+	
+	__slots__ = ()
 
 class FunFormat(StringFunction):
 	"""A $$Format(format, ...args) function call."""
 	
+	__slots__ = ("format", "args")
+	
 	format: StringExpression
 	args: typing.Sequence[Expression]
 
 class FunName(StringFunction):
 	"""A $$Name function call."""
+	
+	__slots__ = ()
 
 class FunRead(StringFunction):
 	"""A $$Read(path) function call."""
 	
+	__slots__ = ("path",)
+	
 	path: StringExpression
 
 class FunResource(StringFunction):
 	"""A $$Resource(path, type, id, name) function call."""
 	
+	__slots__ = ("path", "type", "id", "name")
+	
 	path: StringExpression
 	type: IntExpression
 	id: IntExpression
@@ -285,13 +408,19 @@ class FunResource(StringFunction):
 class FunShell(StringFunction):
 	"""A $$Shell(name) function call."""
 	
+	__slots__ = ("name",)
+	
 	name: StringExpression
 
 class FunTime(StringFunction):
 	"""A $$Time function call."""
+	
+	__slots__ = ()
 
 class FunVersion(StringFunction):
 	"""A $$Version function call."""
+	
+	__slots__ = ()
 
 class ArrayValue(ResourceValue):
 	"""An array value.
@@ -300,17 +429,23 @@ class ArrayValue(ResourceValue):
 	That is, a semicolon may be added at most once at the end of an array iteration (and nowhere else), but is not required in most cases.
 	"""
 	
+	__slots__ = ("values",)
+	
 	values: typing.Sequence[typing.Sequence[ResourceValue]]
 
 class SwitchValue(ResourceValue):
 	"""A switch value."""
 	
+	__slots__ = ("label", "values")
+	
 	label: str
 	values: typing.Sequence[ResourceValue]
 
 class IDRange(Node):
 	"""A resource ID range from begin to end (both inclusive)."""
 	
+	__slots__ = ("begin", "end")
+	
 	begin: IntExpression
 	end: IntExpression
 
@@ -320,6 +455,8 @@ class ResourceSpecTypeDef(Node):
 	The ID is optional and may be a single ID (as an int expression) or an ID range. If present, the type definition only applies to resources with a matching ID. Otherwise the type definition applies to all resources with the given type.
 	"""
 	
+	__slots__ = ("type", "id")
+	
 	type: IntExpression
 	id: typing.Optional[typing.Union[IntExpression, IDRange]]
 
@@ -329,6 +466,8 @@ class ResourceSpecTypeUse(Node):
 	The ID is optional. If present, the type definition restricted to this ID (or a range containing it) is used. Otherwise, the unrestricted type definition is used.
 	"""
 	
+	__slots__ = ("type", "id")
+	
 	type: IntExpression
 	id: typing.Optional[IntExpression]
 
@@ -339,6 +478,8 @@ class ResourceSpecDef(Node):
 	The attributes are required and may be a (possibly empty) sequence of resource attributes or any int expression. If a sequence of attributes is given, they are combined using bitwise or. If an int expression is given, it is used literally.
 	"""
 	
+	__slots__ = ("type", "id", "name", "attributes")
+	
 	type: IntExpression
 	id: IntExpression
 	name: typing.Optional[StringExpression]
@@ -350,11 +491,15 @@ class ResourceSpecUse(Node):
 	id_or_name is optional and may be a single ID (as an int expression), an ID range, or a name. If present, only the resources with a matching ID or name are used. Otherwise all resources with the given type are used.
 	"""
 	
+	__slots__ = ("type", "id_or_name")
+	
 	type: IntExpression
 	id_or_name: typing.Optional[typing.Union[IntExpression, IDRange, StringExpression]]
 
 class Statement(Node):
 	"""Base class for all top-level statements in a file."""
+	
+	__slots__ = ()
 
 class Change(Statement):
 	"""A change statement.
@@ -362,6 +507,8 @@ class Change(Statement):
 	The to_spec is required and specifies what type, ID, name and attributes the resources should be changed to.
 	"""
 	
+	__slots__ = ("from_spec", "to_spec")
+	
 	from_spec: ResourceSpecUse
 	to_spec: ResourceSpecDef
 
@@ -371,6 +518,8 @@ class Data(Statement):
 	The value is optional and specifies the raw data for the resource. It defaults to an empty string (i. e. no data).
 	"""
 	
+	__slots__ = ("spec", "value")
+	
 	spec: ResourceSpecDef
 	value: typing.Optional[StringExpression]
 
@@ -379,6 +528,8 @@ class Delete(Statement):
 	The spec is required and specifies the resources to delete.
 	"""
 	
+	__slots__ = ("spec",)
+	
 	spec: ResourceSpecUse
 
 class EnumConstant(Node):
@@ -387,6 +538,8 @@ class EnumConstant(Node):
 	The value is optional. If present, it specifies an explicit value for the enum constant. Otherwise, the value is that of the previous enum constant plus 1, or if this is the first enum constant, 0.
 	"""
 	
+	__slots__ = ("name", "value")
+	
 	name: str
 	value: typing.Optional[IntExpression]
 
@@ -396,6 +549,8 @@ class Enum(Statement):
 	The constants are required, but may be empty.
 	"""
 	
+	__slots__ = ("name", "constants")
+	
 	name: typing.Optional[str]
 	constants: typing.Sequence[EnumConstant]
 
@@ -403,6 +558,8 @@ class InvertedType(Node):
 	"""An inverted type expression, representing the pseudo-operator "not" inside an Include's from_spec.
 	"""
 	
+	__slots__ = ("type",)
+	
 	type: IntExpression
 
 class Include(Statement):
@@ -412,6 +569,8 @@ class Include(Statement):
 	to_spec is optional and may be a type, or a spec. If a type is given, from_spec must also be a type (not a spec) and all included resources' type is changed to the given type. If a spec is given, all included resources are changed according to the spec. If omitted, the included resources are not changed.
 	"""
 	
+	__slots__ = ("path", "from_spec", "to_spec")
+	
 	path: StringExpression
 	from_spec: typing.Optional[typing.Union[IntExpression, InvertedType, ResourceSpecUse]]
 	to_spec: typing.Optional[typing.Union[IntExpression, ResourceSpecUse]]
@@ -422,6 +581,8 @@ class Read(Statement):
 	The path is required and specifies the file from whose data fork the data should be read.
 	"""
 	
+	__slots__ = ("spec", "path")
+	
 	spec: ResourceSpecDef
 	path: StringExpression
 
@@ -431,14 +592,20 @@ class Resource(Statement):
 	The values are required and must match the applicable type declaration. (This means that they may be empty.)
 	"""
 	
+	__slots__ = ("spec", "values")
+	
 	spec: ResourceSpecDef
 	values: typing.Sequence[ResourceValue]
 
 class SimpleFieldType(Node):
 	"""Base class for all "simple" (non-compound) field types."""
+	
+	__slots__ = ()
 
 class BooleanFieldType(SimpleFieldType):
 	"""A boolean field type."""
+	
+	__slots__ = ()
 
 class NumericFieldType(SimpleFieldType):
 	"""A numeric field type.
@@ -448,6 +615,8 @@ class NumericFieldType(SimpleFieldType):
 	For bitfields, size is an IntExpression specifying the bitfield's size, in bits. For other types, it is None.
 	"""
 	
+	__slots__ = ("signed", "base", "type", "size")
+	
 	class Base(enum.Enum):
 		literal = -1
 		binary = 2
@@ -470,6 +639,8 @@ class CharFieldType(SimpleFieldType):
 	"""A char field type.
 	The char type is semantically equivalent to string[1].
 	"""
+	
+	__slots__ = ()
 
 class StringFieldType(SimpleFieldType):
 	"""A string field type.
@@ -478,6 +649,8 @@ class StringFieldType(SimpleFieldType):
 	The length is an optional IntExpression specifying the length of the string's contents, in bytes. (A cstring's terminating null counts towards the string length, but a pstring's or wstring's length prefix does not.) When compiling, the input string is padded with nulls or truncated to match the length. When decompiling, the length determines how many bytes are part of the string. If omitted, the length is variable. When compiling, the length is that of the input string. When decompiling, the length is inferred (from the length prefix for pstring and wstring, from the position of the first null byte for cstring, or until end of data for string).
 	"""
 	
+	__slots__ = ("format", "type", "length")
+	
 	class Format(enum.Enum):
 		literal = 0
 		hex = 1
@@ -494,16 +667,24 @@ class StringFieldType(SimpleFieldType):
 
 class PointFieldType(SimpleFieldType):
 	"""A point field type."""
+	
+	__slots__ = ()
 
 class RectFieldType(SimpleFieldType):
 	"""A rect field type."""
+	
+	__slots__ = ()
 
 class Field(Node):
 	"""Base class for all field-like declarations."""
+	
+	__slots__ = ()
 
 class Label(Field):
 	"""A label declaration."""
 	
+	__slots__ = ("name",)
+	
 	name: str
 
 class SymbolicConstant(Node):
@@ -512,6 +693,8 @@ class SymbolicConstant(Node):
 	The value is optional. If present, its type must match that of the field.
 	"""
 	
+	__slots__ = ("name", "value")
+	
 	name: str
 	value: typing.Optional[ResourceValue]
 
@@ -523,6 +706,8 @@ class SimpleField(Field):
 	is_key specifies whether the field is a switch case key. If true, a value must be given.
 	"""
 	
+	__slots__ = ("type", "value", "symbolic_constants", "is_key")
+	
 	type: SimpleFieldType
 	value: typing.Optional[ResourceValue]
 	symbolic_constants: typing.Sequence[SymbolicConstant]
@@ -534,6 +719,8 @@ class FillField(Field):
 	The count is an optional multiplier to the base size. If omitted, defaults to 1.
 	"""
 	
+	__slots__ = ("type", "count")
+	
 	class Type(enum.Enum):
 		bit = 1
 		nibble = 4
@@ -549,6 +736,8 @@ class AlignField(Field):
 	The type is required and specifies the unit up to which padding is added.
 	"""
 	
+	__slots__ = ("type",)
+	
 	class Type(enum.Enum):
 		nibble = 4
 		byte = 8
@@ -565,6 +754,8 @@ class ArrayField(Field):
 	The fields are required, but may be empty.
 	"""
 	
+	__slots__ = ("wide", "label", "count", "fields")
+	
 	wide: bool
 	label: typing.Optional[str]
 	count: typing.Optional[int]
@@ -576,6 +767,8 @@ class SwitchCase(Node):
 	The fields are required and must contain one or more fields, of which exactly one must have the is_key flag set.
 	"""
 	
+	__slots__ = ("label", "fields")
+	
 	label: str
 	fields: typing.Sequence[Field]
 
@@ -584,6 +777,8 @@ class Switch(Statement):
 	The cases are required and must not be empty.
 	"""
 	
+	__slots__ = ("cases",)
+	
 	cases: typing.Sequence[SwitchCase]
 
 class Type(Statement):
@@ -593,6 +788,8 @@ class Type(Statement):
 	The from_spec is optional. It specifies another type (and optionally an ID) from which to copy the definition to this type. Must be omitted if fields are given.
 	"""
 	
+	__slots__ = ("spec", "fields", "from_spec")
+	
 	spec: ResourceSpecTypeDef
 	fields: typing.Optional[typing.Sequence[Field]]
 	from_spec: typing.Optional[ResourceSpecTypeUse]
@@ -602,4 +799,6 @@ class File(Node):
 	This is the root node of an AST created by parsing a file.
 	"""
 	
+	__slots__ = ("statements",)
+	
 	statements: typing.Sequence[Statement]
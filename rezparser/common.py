@@ -1,4 +1,5 @@
 import functools
+import sys
 
 import ply.lex
 
@@ -46,13 +47,14 @@ class Token(ply.lex.LexToken):
 	def __init__(self, type, value=None, lineno=None, lexpos=None, **kwargs):
 		super().__init__()
 		
+		# Token types are always interned, so that code that handles many tokens can compare types by identity instead of by value.
 		if isinstance(type, (Token, ply.lex.LexToken)):
-			self.type = type.type
+			self.type = sys.intern(type.type)
 			self.value = type.value
 			self.lineno = type.lineno
 			self.lexpos = type.lexpos
 		else:
-			self.type = type
+			self.type = sys.intern(type)
 			self.value = value
 			self.lineno = lineno
 			self.lexpos = lexpos
@@ -1,3 +1,6 @@
+import collections
+import sys
+
 import ply.lex
 
 from . import common
@@ -13,6 +16,8 @@ class LexError(common.RezParserError):
 
 
 class NoOpLexer(object):
+	__slots__ = ("lexer", "tokens", "_lexer_token", "_lineno", "_lexpos", "_filename")
+	
 	@property
 	def lineno(self):
 		if self.lexer is None:
@@ -59,25 +64,43 @@ class NoOpLexer(object):
 		super().__init__()
 		
 		self.lexer = lexer
-		self.tokens = []
+		self.tokens = collections.deque()
+		self._cache_lexer_token()
 	
 	def __iter__(self):
 		return iter(self.token, None)
 	
+	@staticmethod
+	def _no_token():
+		return None
+	
+	def _cache_lexer_token(self):
+		# token is called once for every token, so the underlying lexer's token method is looked up only once here instead of on every call.
+		self._lexer_token = NoOpLexer._no_token if self.lexer is None else self.lexer.token
+	
 	def input(self, inp):
 		if isinstance(inp, str):
 			self.lexer.input(inp)
 		else:
-			self.tokens = list(inp)
+			# The token deque is reused instead of replaced, because the preprocessor passes the tokens of every expression it parses to the same NoOpLexer.
+			self.tokens.clear()
+			self.tokens.extend(inp)
+		
+		self._cache_lexer_token()
+	
+	def feed(self, tokens):
+		"""Append the given tokens to the ones that are returned before any tokens from the underlying lexer.
+		
+		Unlike input, this keeps any tokens that have not been returned yet, and does not affect the underlying lexer.
+		"""
+		
+		self.tokens.extend(tokens)
 	
 	def token(self):
-		try:
-			return self.tokens.pop(0)
-		except IndexError:
-			if self.lexer is None:
-				return None
-			else:
-				return self.lexer.token()
+		if self.tokens:
+			return self.tokens.popleft()
+		else:
+			return self._lexer_token()
 	
 	def clone(self):
 		cloned = NoOpLexer(None if self.lexer is None else self.lexer.clone())
@@ -248,8 +271,53 @@ class RezLexer(object):
 		"$$year", # Current year
 	)
 	
-	tokens += tuple(keyword.upper() for keyword in keywords)
-	tokens += tuple("FUN_" + fun[2:].upper() for fun in rez_functions)
+	# Groups of keywords that are always interchangeable in the grammar. All keywords in a group have the same token type, and the keyword itself is stored in the token value, so that the parser can accept any of them with a single shift instead of one alternative (and state) per keyword.
+	# (Fill and align sizes are not grouped, because byte is also a field type.)
+	keyword_groups = {
+		"RESOURCE_ATTRIBUTE": (
+			"appheap",
+			"changed",
+			"compressed",
+			"locked",
+			"nonpreload",
+			"nonpurgeable",
+			"preload",
+			"protected",
+			"purgeable",
+			"sysheap",
+			"unchanged",
+			"uncompressed",
+			"unlocked",
+			"unprotected",
+		),
+		"SIMPLE_FIELD_MODIFIER": (
+			"binary",
+			"decimal",
+			"hex",
+			"key",
+			"literal",
+			"octal",
+			"unsigned",
+		),
+		"STRING_TYPE_NAME": (
+			"cstring",
+			"pstring",
+			"string",
+			"wstring",
+		),
+	}
+	
+	# Mappings of lowercased keywords and Rez function names to their token types.
+	# The lexer looks up the type of every keyword and function token here, so that all tokens of the same type share one interned type string (the same object that is used as a key in the parser tables), instead of building a new string for every token.
+	keyword_types = {keyword: sys.intern(keyword.upper()) for keyword in keywords}
+	keyword_types.update({keyword: sys.intern(token_type) for token_type, group in keyword_groups.items() for keyword in group})
+	rez_function_types = {fun: sys.intern("FUN_" + fun[2:].upper()) for fun in rez_functions}
+	
+	# Set of all token types that are produced for keywords.
+	keyword_token_types = frozenset(keyword_types.values())
+	
+	tokens += tuple(dict.fromkeys(keyword_types.values()))
+	tokens += tuple(rez_function_types.values())
 	
 	def t_error(self, t):
 		try:
@@ -257,7 +325,7 @@ class RezLexer(object):
 		except ValueError:
 			newline_pos = len(t.value)
 		
-		raise LexError(repr(t.value[:newline_pos]), filename=self.filename, lineno=self.lineno)
+		raise LexError(repr(t.value[:newline_pos]), filename=t.lexer.filename, lineno=t.lexer.lineno)
 	
 	_pp = r"(?m:^)[ \t]*\#[ \t]*"
 	_id = r"[A-Za-z_][A-Za-z0-9_]*"
@@ -316,7 +384,7 @@ class RezLexer(object):
 		sublexer = self.lexer.clone()
 		sublexer.input(text)
 		t.pp_define_name = sublexer.token().value
-		t.pp_define_value = list(sublexer)
+		t.pp_define_value = tuple(sublexer)
 		
 		return t
 	
@@ -367,31 +435,39 @@ class RezLexer(object):
 	
 	@ply.lex.TOKEN(r"\n")
 	def t_NEWLINE(self, t):
-		self.lexer.lineno += 1
+		# t.lexer is the PLY lexer that produced the token, which is a clone of self.lexer for the preprocessor's inputs and includes.
+		t.lexer.lineno += 1
 		return t
 	
 	t_ignore_WHITESPACE = r"[ \t]+"
 	
 	@ply.lex.TOKEN(_id)
 	def t_IDENTIFIER(self, t):
-		if t.value.lower() in RezLexer.keywords:
-			t.type = t.value.upper()
-		else:
-			t.type = "IDENTIFIER"
-		
+		t.type = RezLexer.keyword_types.get(t.value.lower(), "IDENTIFIER")
+		# The same few keywords and names (macros, constants, labels) appear over and over again in a typical file, and many of them end up in the AST. Interning makes all occurrences share one string object.
+		t.value = sys.intern(t.value)
 		return t
 	
 	@ply.lex.TOKEN(r"\$\$"+_id)
 	def t_REZ_FUNCTION(self, t):
-		if t.value.lower() not in RezLexer.rez_functions:
-			raise LexError("Unknown Rez function: " + t.value, filename=self.filename, lineno=self.lineno)
-		
-		t.type = "FUN_" + t.value[2:].upper()
+		try:
+			t.type = RezLexer.rez_function_types[t.value.lower()]
+		except KeyError:
+			raise LexError("Unknown Rez function: " + t.value, filename=t.lexer.filename, lineno=t.lexer.lineno)
 		
 		return t
 	
-	t_STRINGLIT_TEXT = r"\"(?:[^\\\"\n]|\\.)*\""
-	t_STRINGLIT_HEX = r"\$\"[ \t]*(?:[0-9A-Fa-f][ \t]*[0-9A-Fa-f][ \t]*)*\""
+	@ply.lex.TOKEN(r"\"(?:[^\\\"\n]|\\.)*\"")
+	def t_STRINGLIT_TEXT(self, t):
+		# The value stays text, because encoding it here would fail on characters that can't be encoded even in inactive preprocessor blocks. Whether it contains escape sequences is noted for the parser, which can then encode most literals directly instead of unescaping them.
+		t.stringlit_escapes = "\\" in t.value
+		return t
+	
+	@ply.lex.TOKEN(r"\$\"[ \t]*(?:[0-9A-Fa-f][ \t]*[0-9A-Fa-f][ \t]*)*\"")
+	def t_STRINGLIT_HEX(self, t):
+		# The pattern already guarantees that the contents are valid, so the literal is decoded here once, and the token value is the resulting bytes.
+		t.value = bytes.fromhex("".join(t.value[2:-1].split()))
+		return t
 	
 	# These tokens are defined using methods instead of plain strings to enforce precedence.
 	# The decimal int literal MUST come last, to prevent the leading zeros of the other int literals from being considered a separate decimal literal.
@@ -486,6 +562,9 @@ class RezLexer(object):
 			self.filename = filename
 		else:
 			self.lexer = _lexer
+		
+		# The preprocessor or parser calls token once for every token, so the PLY lexer's token method is exposed directly, instead of through a wrapper method that would add a Python call per token.
+		self.token = self.lexer.token
 	
 	def __iter__(self):
 		return iter(self.token, None)
@@ -494,9 +573,6 @@ class RezLexer(object):
 		self.lexer.input(s.replace("\\\n", ""))
 		return iter(self)
 	
-	def token(self):
-		return self.lexer.token()
-	
 	def clone(self):
 		new_lexer = RezLexer(_lexer=self.lexer.clone())
 		new_lexer.filename = self.filename
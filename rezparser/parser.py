@@ -1,3 +1,10 @@
+import collections
+import copy
+import functools
+import os
+import pickle
+import sys
+
 import ply.yacc
 
 from . import common
@@ -14,6 +21,22 @@ class ParseError(common.RezParserError):
 	__slots__ = ()
 
 
+# Mapping of single-character escape sequences (without the leading backslash) to the byte values they represent.
+# Note that \r and \n are swapped compared to C, see the note in preprocessor.py.
+_SIMPLE_ESCAPES = {
+	"t": 0x09,
+	"b": 0x08,
+	"r": 0x0a,
+	"n": 0x0d,
+	"f": 0x0c,
+	"v": 0x0b,
+	"?": 0x7f,
+	"\\": 0x5c,
+	"'": 0x27,
+	'"': 0x22,
+}
+
+
 def _unescape_string(s):
 	ret = bytearray()
 	lastpos = 0
@@ -67,18 +90,7 @@ def _unescape_string(s):
 			ret.append(int(s[pos+1:pos+4], 8))
 			lastpos = pos+4
 		else:
-			ret.append({
-				"t": 0x09,
-				"b": 0x08,
-				"r": 0x0a,
-				"n": 0x0d,
-				"f": 0x0c,
-				"v": 0x0b,
-				"?": 0x7f,
-				"\\": 0x5c,
-				"'": 0x27,
-				'"': 0x22,
-			}.get(c, ord(c)))
+			ret.append(_SIMPLE_ESCAPES.get(c, ord(c)))
 			lastpos = pos+2
 		
 		pos = s.find("\\", lastpos)
@@ -87,6 +99,358 @@ def _unescape_string(s):
 	return bytes(ret)
 
 
+def _build_numeric_field_type(typename, size, signed, base):
+	return ast.NumericFieldType(
+		signed=signed,
+		base=ast.NumericFieldType.Base[base or "decimal"],
+		type=ast.NumericFieldType.Type[typename],
+		size=size,
+	)
+
+
+def _build_string_field_type(typename, size, signed, base):
+	return ast.StringFieldType(
+		format=ast.StringFieldType.Format[base or "literal"],
+		type=ast.StringFieldType.Type[typename],
+		length=size,
+	)
+
+
+# Field type names (lowercased) that the unsigned and base modifiers can be applied to.
+_NUMERIC_TYPE_NAMES = frozenset({"bitstring", "byte", "integer", "longint"})
+
+# Field modifiers (lowercased) that select the base of a numeric field or the format of a string field.
+_BASE_MODIFIERS = frozenset({"binary", "octal", "decimal", "hex", "literal"})
+
+# Mapping of simple field type names (lowercased, with int already normalized to integer) to functions that construct the corresponding ast.SimpleFieldType.
+# Each function is called with the type name, the size (or length) expression, the signedness, and the base modifier (or None).
+_FIELD_TYPE_BUILDERS = {
+	"boolean": lambda typename, size, signed, base: ast.BooleanFieldType(),
+	"bitstring": _build_numeric_field_type,
+	"byte": _build_numeric_field_type,
+	"integer": _build_numeric_field_type,
+	"longint": _build_numeric_field_type,
+	"char": lambda typename, size, signed, base: ast.CharFieldType(),
+	"string": _build_string_field_type,
+	"cstring": _build_string_field_type,
+	"pstring": _build_string_field_type,
+	"wstring": _build_string_field_type,
+	"point": lambda typename, size, signed, base: ast.PointFieldType(),
+	"rect": lambda typename, size, signed, base: ast.RectFieldType(),
+}
+
+
+def _int_literal_value(token_type, text):
+	"""Convert the text of an int literal token of the given type to its value.
+	Raises ValueError if a character literal contains an invalid escape sequence.
+	"""
+	
+	# Dispatch on the token type instead of inspecting the literal's prefix, with the most common literal types first.
+	if token_type == "INTLIT_DEC":
+		return int(text, 10)
+	elif token_type == "INTLIT_HEX":
+		return int(text[1:] if text.startswith("$") else text[2:], 16)
+	elif token_type == "INTLIT_CHAR":
+		return int.from_bytes(_unescape_string(text[1:-1]), "big")
+	elif token_type == "INTLIT_OCT":
+		return int(text, 8)
+	elif token_type == "INTLIT_BIN":
+		return int(text[2:], 2)
+	else:
+		raise NotImplementedError(f"Unhandled int literal type: {token_type}")
+
+
+# Small literals like 0 and 1 are very common (especially after macro expansion), so identical IntLiteral nodes are shared instead of allocating a new one every time.
+@functools.lru_cache(maxsize=256)
+def _int_literal(value):
+	return ast.IntLiteral(value=value)
+
+
+# Mapping of unary operator token values to the AST classes that represent them.
+_UNARY_OPERATORS = {
+	"-": ast.Negative,
+	"!": ast.BoolNot,
+	"~": ast.BitNot,
+}
+
+# Mapping of binary operator token values to the AST classes that represent them.
+_BINARY_OPERATORS = {
+	"*": ast.Multiply,
+	"/": ast.Divide,
+	"%": ast.Modulo,
+	"+": ast.Add,
+	"-": ast.Subtract,
+	"<<": ast.BitShiftLeft,
+	">>": ast.BitShiftRight,
+	"<": ast.LessThan,
+	">": ast.GreaterThan,
+	"<=": ast.LessThanEqual,
+	">=": ast.GreaterThanEqual,
+	"==": ast.Equal,
+	"!=": ast.NotEqual,
+	"&": ast.BitAnd,
+	"^": ast.BitXor,
+	"|": ast.BitOr,
+	"&&": ast.BoolAnd,
+	"||": ast.BoolOr,
+}
+
+
+_INTLIT_TYPES = frozenset({"INTLIT_DEC", "INTLIT_HEX", "INTLIT_OCT", "INTLIT_BIN", "INTLIT_CHAR"})
+_UNARY_OPERATOR_TYPES = frozenset({"MINUS", "BOOLNOT", "BITNOT"})
+
+
+class _UnexpectedEnd(Exception):
+	"""Raised by RezParser.p_error when the input ends in the middle of a statement or expression.
+	PLY passes no token (and so no lexer) to p_error in that case, so it is turned into a ParseError by RezParser._parse, which knows the lexer and can give the location.
+	"""
+	
+	__slots__ = ()
+
+
+class _UnsupportedExpression(Exception):
+	"""Raised by _IntExpressionReader for input that it does not handle."""
+	
+	__slots__ = ()
+
+
+class _IntExpressionReader(object):
+	"""Precedence-climbing reader for simple int expressions given as a list of tokens.
+	
+	Most expressions parsed by the preprocessor (#if conditions and enum values) consist only of int literals, identifiers, resource attributes, parentheses and operators. This reader handles exactly those expressions, and produces the same AST as the grammar rules in RezParser, but without going through the LALR automaton. Anything else (including all syntax errors) raises _UnsupportedExpression, and must be parsed normally so that it is handled (or reported) by the grammar.
+	"""
+	
+	__slots__ = ("tokens", "pos")
+	
+	def __init__(self, tokens):
+		super().__init__()
+		
+		self.tokens = tokens
+		self.pos = 0
+	
+	def _peek_type(self):
+		try:
+			return self.tokens[self.pos].type
+		except IndexError:
+			return None
+	
+	def read(self):
+		expr = self._read_binary(1)
+		if self.pos != len(self.tokens):
+			raise _UnsupportedExpression()
+		return expr
+	
+	def _read_binary(self, min_precedence):
+		left = self._read_unary()
+		while True:
+			precedence = _BINARY_PRECEDENCE.get(self._peek_type())
+			if precedence is None or precedence < min_precedence:
+				return left
+			
+			op = self.tokens[self.pos].value
+			self.pos += 1
+			# All binary operators are left-associative, so the right operand only includes operators with higher precedence.
+			right = self._read_binary(precedence + 1)
+			left = _BINARY_OPERATORS[op](left=left, right=right)
+	
+	def _read_unary(self):
+		try:
+			tok = self.tokens[self.pos]
+		except IndexError:
+			raise _UnsupportedExpression()
+		self.pos += 1
+		
+		token_type = tok.type
+		if token_type in _INTLIT_TYPES:
+			try:
+				return _int_literal(_int_literal_value(token_type, tok.value))
+			except ValueError:
+				raise _UnsupportedExpression()
+		elif token_type == "IDENTIFIER":
+			if self._peek_type() == "LBRACKET":
+				raise _UnsupportedExpression()
+			return ast.IntSymbol(name=tok.value)
+		elif token_type == "RESOURCE_ATTRIBUTE":
+			return ast.ResourceAttribute(value=ast.ResourceAttribute.Value[tok.value.lower()])
+		elif token_type in _UNARY_OPERATOR_TYPES:
+			return _UNARY_OPERATORS[tok.value](value=self._read_unary())
+		elif token_type == "LPAREN":
+			expr = self._read_binary(1)
+			if self._peek_type() != "RPAREN":
+				raise _UnsupportedExpression()
+			self.pos += 1
+			return expr
+		else:
+			raise _UnsupportedExpression()
+
+
+# Mapping of Rez function token types to functions that create the AST node for a call from the production's values. Used by both int_function_call and string_function_call, so that a call is dispatched on its token type instead of comparing the function name against every known function.
+_FUNCTION_CALLS = {
+	"FUN_ARRAYINDEX": lambda p: ast.FunArrayIndex(array_name=p[3]),
+	"FUN_ATTRIBUTES": lambda p: ast.FunAttributes(),
+	"FUN_BITFIELD": lambda p: ast.FunBitField(start=p[3], offset=p[5], length=p[7]),
+	"FUN_BYTE": lambda p: ast.FunByte(start=p[3]),
+	"FUN_COUNTOF": lambda p: ast.FunCountOf(array_name=p[3]),
+	"FUN_DATE": lambda p: ast.FunDate(),
+	"FUN_DAY": lambda p: ast.FunDay(),
+	"FUN_FORMAT": lambda p: ast.FunFormat(format=p[3], args=p[4]),
+	"FUN_HOUR": lambda p: ast.FunHour(),
+	"FUN_ID": lambda p: ast.FunID(),
+	"FUN_LONG": lambda p: ast.FunLong(start=p[3]),
+	"FUN_MINUTE": lambda p: ast.FunMinute(),
+	"FUN_MONTH": lambda p: ast.FunMonth(),
+	"FUN_NAME": lambda p: ast.FunName(),
+	"FUN_PACKEDSIZE": lambda p: ast.FunPackedSize(start=p[3], row_bytes=p[5], row_count=p[7]),
+	"FUN_READ": lambda p: ast.FunRead(path=p[3]),
+	"FUN_RESOURCE": lambda p: ast.FunResource(path=p[3], type=p[5], id=p[7], name=p[9]),
+	"FUN_RESOURCESIZE": lambda p: ast.FunResourceSize(),
+	"FUN_SECOND": lambda p: ast.FunSecond(),
+	"FUN_SHELL": lambda p: ast.FunShell(name=p[3]),
+	"FUN_TIME": lambda p: ast.FunTime(),
+	"FUN_TYPE": lambda p: ast.FunType(),
+	"FUN_VERSION": lambda p: ast.FunVersion(),
+	"FUN_WEEKDAY": lambda p: ast.FunWeekday(),
+	"FUN_WORD": lambda p: ast.FunWord(start=p[3]),
+	"FUN_YEAR": lambda p: ast.FunYear(),
+}
+
+
+# Maximum number of parsed expressions that a RezParser created with memoize=True keeps.
+_EXPR_CACHE_SIZE = 4096
+
+
+def _table_cache_dir(path):
+	"""Return the directory in which generated parser tables are cached, creating it if necessary.
+	path is the directory requested by the caller, or None to use the REZPARSER_TABLE_CACHE_DIR environment variable instead.
+	Returns None if table caching is not enabled or the directory cannot be created.
+	"""
+	
+	if path is None:
+		path = os.environ.get("REZPARSER_TABLE_CACHE_DIR")
+	if not path:
+		return None
+	
+	try:
+		os.makedirs(path, exist_ok=True)
+	except OSError:
+		return None
+	
+	return path
+
+
+# Errors that can occur while reading a pickled table file that is unreadable, truncated or otherwise corrupt.
+_TABLE_CACHE_ERRORS = (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError)
+
+
+def _check_table_cache(path):
+	"""Check that the pickled parser tables at path (if the file exists) can be read, and remove the file if not, so that PLY generates and writes the tables again.
+	PLY itself only handles missing and outdated table files - any other error while reading the file is passed on, without closing the file.
+	Returns False if a broken file could not be removed, in which case it must not be passed to PLY.
+	"""
+	
+	try:
+		with open(path, "rb") as f:
+			while f.peek(1):
+				pickle.load(f)
+	except FileNotFoundError:
+		pass
+	except _TABLE_CACHE_ERRORS:
+		try:
+			os.remove(path)
+		except OSError:
+			return False
+	
+	return True
+
+
+# Mapping of (parser class, name) to a PLY parser for every grammar that was already built in this process by _build_parser with default settings. These parsers are never used directly - their grammar actions and error function are not bound to anything.
+# The tables only depend on the grammar, so later instances of the same parser class use copies of these parsers, which share the tables, but have their own productions bound to each instance's methods.
+_shared_parsers = {}
+
+
+def _bind_parser(module, shared):
+	"""Create a copy of the PLY parser shared, with the grammar actions and error function bound to the methods of module.
+	Pass None as module to unbind them instead.
+	"""
+	
+	parser = copy.copy(shared)
+	parser.productions = [copy.copy(production) for production in shared.productions]
+	if module is None:
+		for production in parser.productions:
+			production.callable = None
+		parser.errorfunc = None
+	else:
+		functions = {production.func: getattr(module, production.func) for production in parser.productions if production.func}
+		for production in parser.productions:
+			production.bind(functions)
+		parser.errorfunc = module.p_error
+	
+	return parser
+
+
+def _build_parser(module, name, **kwargs):
+	"""Build a PLY parser from the grammar rules of module (a parser object), using the shared table cache and debug settings.
+	name is used in the names of the table cache and debug files, and must be different for every grammar.
+	
+	The generated tables are only cached on disk if a table_cache_dir keyword argument or the REZPARSER_TABLE_CACHE_DIR environment variable names a directory to store them in. By default the tables are only kept in memory, and are shared by all parsers of the same class in this process.
+	Because of this sharing, the cache directory is only used by the first parser of each class in a process. Later parsers reuse the tables in memory, and don't read or write any cache directory, including one passed to them as table_cache_dir.
+	"""
+	
+	table_cache_dir = kwargs.pop("table_cache_dir", None)
+	
+	# Parsers created with custom yacc options (such as debug mode) always build or load their own tables.
+	shared = not kwargs
+	if shared:
+		try:
+			shared_parser = _shared_parsers[type(module), name]
+		except KeyError:
+			pass
+		else:
+			return _bind_parser(module, shared_parser)
+	
+	# Building the LALR tables is by far the slowest part of creating a parser, so if a cache directory is configured, the tables are pickled into it and reused by later processes.
+	# PLY checks the grammar signature stored in the pickle file, and rebuilds the tables if the grammar has changed.
+	# PLY's own table modules are never written - they would go next to the source files, which is usually not writable for an installed package. Passing write_tables=False disables the pickle cache as well, so that the tables are only kept in memory.
+	if kwargs.pop("write_tables", True):
+		table_cache_dir = _table_cache_dir(table_cache_dir)
+	else:
+		table_cache_dir = None
+	
+	# PLY defaults to debug mode, which writes a large debug file into the current directory every time the tables are generated. Grammar warnings are only of interest when debugging the grammar, so they are also silenced unless debug mode is requested explicitly.
+	kwargs.setdefault("debug", False)
+	if not kwargs["debug"]:
+		kwargs.setdefault("errorlog", ply.yacc.NullLogger())
+	
+	kwargs.update(module=module, debugfile=f"_debug_{name}.out", write_tables=False)
+	
+	picklefile = None
+	if table_cache_dir is not None:
+		picklefile = os.path.join(table_cache_dir, f"_table_{name}.pickle")
+		if not _check_table_cache(picklefile):
+			picklefile = None
+	
+	try:
+		parser = ply.yacc.yacc(picklefile=picklefile, **kwargs)
+	except _TABLE_CACHE_ERRORS:
+		if picklefile is None:
+			raise
+		
+		# The file was checked above, but may have been replaced since then (for example by another process writing its tables). Build the tables again without the cache.
+		parser = ply.yacc.yacc(picklefile=None, **kwargs)
+	
+	# The parser looks up every token's type in the action table. Identifier and keyword token types from the lexer (and the types of all common.Token objects) are interned strings, but tables loaded from a pickle file contain separate copies of them, which can only be matched by comparing their contents. Interning the table keys makes these lookups succeed on the identity check.
+	parser.action = {
+		state: {sys.intern(token_type): action for token_type, action in actions.items()}
+		for state, actions in parser.action.items()
+	}
+	
+	if shared:
+		# Don't keep the shared parser bound to this module, so that it can be garbage-collected.
+		_shared_parsers[type(module), name] = _bind_parser(None, parser)
+	
+	return parser
+
+
 # noinspection PyMethodMayBeStatic, PyPep8Naming
 class RezParser(object):
 	"""Rez preprocessor and parser, based on the description and syntax given in Appendix C, "The Rez Language", in "Building and Managing Programs in MPW, 2nd Edition". A copy of this file can be found in the "docs" folder in this repo.
@@ -94,34 +458,58 @@ class RezParser(object):
 	The server can be accessed via a web interface ("http://www.max1zzz.co.uk:8000", username "mg", password "mg"), or via FTP ("ftp://www.max1zzz.co.uk:21", username "mg", password "mg"), or via one of the other methods listed at "http://max1zzz.co.uk/servers.html".
 	"""
 	
-	tokens = lexer.RezLexer.tokens
+	__slots__ = ("statement_callback", "expr_cache", "start_lexer", "parser")
+	
+	# The PARSE_* tokens are never produced by the lexer. One of them is inserted at the start of the token stream to select what kind of input is parsed, so that a single set of LALR tables can be used for both files and expressions.
+	tokens = lexer.RezLexer.tokens + ("PARSE_FILE", "PARSE_EXPR")
+	
+	start = "start"
+	
+	# NOTE: All rules that collect lists are left-recursive ("items : first | items separator item"), so the parser reduces after every item and its stack depth does not grow with the length of the list. Please keep it that way when adding new list rules.
+	# The binary operator rules are written as "int_expression OP int_expression", but are left-associative through the precedence table below, so long operator chains are reduced as they are read as well.
 	
-	start = "Start symbol must be set manually"
+	# Operator precedence and associativity for int expressions, from lowest to highest precedence.
+	# UNARY is not a real token, it is only used as the precedence of the unary operator rules (because MINUS is also a binary operator with lower precedence).
+	precedence = (
+		("left", "BOOLOR"),
+		("left", "BOOLAND"),
+		("left", "BITOR"),
+		("left", "BITXOR"),
+		("left", "BITAND"),
+		("left", "EQUAL", "NOTEQUAL"),
+		("left", "LESS", "GREATER", "LESSEQUAL", "GREATEREQUAL"),
+		("left", "SHIFTLEFT", "SHIFTRIGHT"),
+		("left", "PLUS", "MINUS"),
+		("left", "MULTIPLY", "DIVIDE", "MODULO"),
+		("right", "UNARY"),
+	)
 	
 	def p_error(self, t):
+		if t is None:
+			raise _UnexpectedEnd()
+		
 		raise ParseError(t, filename=t.lexer.filename, lineno=t.lineno)
 	
 	def p_empty(self, p):
 		"""empty : """
 		
 		p[0] = []
-		return p
 	
 	def p_comma_opt(self, p):
 		"""comma_opt : empty
 		| COMMA
 		"""
 		
-		p[0] = p[1]
-		return p
+		# The value is never used.
+		p[0] = None
 	
 	def p_semicolon_opt(self, p):
 		"""semicolon_opt : empty
 		| SEMICOLON
 		"""
 		
-		p[0] = p[1]
-		return p
+		# The value is never used.
+		p[0] = None
 	
 	def p_intlit(self, p):
 		"""intlit : INTLIT_DEC
@@ -131,45 +519,17 @@ class RezParser(object):
 		| INTLIT_CHAR
 		"""
 		
-		if p[1].startswith("'"):
-			try:
-				unescaped = _unescape_string(p[1][1:-1])
-			except ValueError as e:
-				raise ParseError(str(e), filename=p[-1].lexer.filename, lineno=p[-1].lineno)
-			value = int.from_bytes(unescaped, "big")
-		elif p[1].startswith("$"):
-			value = int(p[1][1:], 16)
-		elif p[1].startswith("0X") or p[1].startswith("0x"):
-			value = int(p[1][2:], 16)
-		elif p[1].startswith("0B") or p[1].startswith("0b"):
-			value = int(p[1][2:], 2)
-		elif p[1].startswith("0"):
-			value = int(p[1], 8)
-		else:
-			value = int(p[1], 10)
+		try:
+			value = _int_literal_value(p.slice[1].type, p[1])
+		except ValueError as e:
+			raise ParseError(str(e), filename=p.lexer.filename, lineno=p.lexer.lineno)
 		
-		p[0] = ast.IntLiteral(value=value)
-		return p
+		p[0] = _int_literal(value)
 	
 	def p_resource_attribute(self, p):
-		"""resource_attribute : COMPRESSED
-		| UNCOMPRESSED
-		| CHANGED
-		| UNCHANGED
-		| PRELOAD
-		| NONPRELOAD
-		| PROTECTED
-		| UNPROTECTED
-		| LOCKED
-		| UNLOCKED
-		| PURGEABLE
-		| NONPURGEABLE
-		| SYSHEAP
-		| APPHEAP
-		"""
+		"""resource_attribute : RESOURCE_ATTRIBUTE"""
 		
 		p[0] = ast.ResourceAttribute(value=ast.ResourceAttribute.Value[p[1].lower()])
-		return p
 	
 	def p_int_function_call(self, p):
 		"""int_function_call : FUN_ARRAYINDEX LPAREN IDENTIFIER comma_opt RPAREN
@@ -192,47 +552,7 @@ class RezParser(object):
 		| FUN_YEAR
 		"""
 		
-		name = p[1].lower()[2:]
-		if name == "arrayindex":
-			p[0] = ast.FunArrayIndex(array_name=p[3])
-		elif name == "attributes":
-			p[0] = ast.FunAttributes()
-		elif name == "bitfield":
-			p[0] = ast.FunBitField(start=p[3], offset=p[5], length=p[7])
-		elif name == "byte":
-			p[0] = ast.FunByte(start=p[3])
-		elif name == "countof":
-			p[0] = ast.FunCountOf(array_name=p[3])
-		elif name == "day":
-			p[0] = ast.FunDay()
-		elif name == "hour":
-			p[0] = ast.FunHour()
-		elif name == "id":
-			p[0] = ast.FunID()
-		elif name == "long":
-			p[0] = ast.FunLong(start=p[3])
-		elif name == "minute":
-			p[0] = ast.FunMinute()
-		elif name == "month":
-			p[0] = ast.FunMonth()
-		elif name == "packedsize":
-			p[0] = ast.FunPackedSize(start=p[3], row_bytes=p[5], row_count=p[7])
-		elif name == "resourcesize":
-			p[0] = ast.FunResourceSize()
-		elif name == "second":
-			p[0] = ast.FunSecond()
-		elif name == "type":
-			p[0] = ast.FunType()
-		elif name == "weekday":
-			p[0] = ast.FunWeekday()
-		elif name == "word":
-			p[0] = ast.FunWord(start=p[3])
-		elif name == "year":
-			p[0] = ast.FunYear()
-		else:
-			raise NotImplementedError(f"Unhandled int function: {name}")
-		
-		return p
+		p[0] = _FUNCTION_CALLS[p.slice[1].type](p)
 	
 	def p_label_subscript_indices(self, p):
 		"""label_subscript_indices : int_expression
@@ -242,17 +562,15 @@ class RezParser(object):
 		if len(p) == 2:
 			p[0] = [p[1]]
 		else:
-			p[0] = p[1] + [p[3]]
-		
-		return p
+			p[1].append(p[3])
+			p[0] = p[1]
 	
-	def p_int_expression_simple(self, p):
-		"""int_expression_simple : intlit
+	def p_int_expression_operand(self, p):
+		"""int_expression : intlit
 		| resource_attribute
 		| int_function_call
 		| IDENTIFIER
 		| IDENTIFIER LBRACKET label_subscript_indices RBRACKET
-		| LPAREN int_expression RPAREN
 		"""
 		
 		if isinstance(p[1], str):
@@ -260,220 +578,59 @@ class RezParser(object):
 				p[0] = ast.LabelSubscript(name=p[1], subscripts=p[3])
 			else:
 				p[0] = ast.IntSymbol(name=p[1])
-		elif len(p) > 2:
-			p[0] = p[2]
-		else:
-			p[0] = p[1]
-		
-		return p
-	
-	def p_int_expression_unaryop(self, p):
-		"""int_expression_unaryop : int_expression_simple
-		| MINUS int_expression_unaryop
-		| BOOLNOT int_expression_unaryop
-		| BITNOT int_expression_unaryop
-		"""
-		
-		if len(p) > 2:
-			if p[1] == "-":
-				p[0] = ast.Negative(value=p[2])
-			elif p[1] == "!":
-				p[0] = ast.BoolNot(value=p[2])
-			elif p[1] == "~":
-				p[0] = ast.BitNot(value=p[2])
-			else:
-				raise NotImplementedError(f"Unhandled unary operator: {p[1]}")
-		else:
-			p[0] = p[1]
-		
-		return p
-	
-	def p_int_expression_muldiv(self, p):
-		"""int_expression_muldiv : int_expression_unaryop
-		| int_expression_muldiv MULTIPLY int_expression_unaryop
-		| int_expression_muldiv DIVIDE int_expression_unaryop
-		| int_expression_muldiv MODULO int_expression_unaryop
-		"""
-		
-		if len(p) > 2:
-			if p[2] == "*":
-				p[0] = ast.Multiply(left=p[1], right=p[3])
-			elif p[2] == "/":
-				p[0] = ast.Divide(left=p[1], right=p[3])
-			elif p[2] == "%":
-				p[0] = ast.Modulo(left=p[1], right=p[3])
-			else:
-				raise NotImplementedError(f"Unhandled binary operator: {p[2]}")
-		else:
-			p[0] = p[1]
-		
-		return p
-	
-	def p_int_expression_plusminus(self, p):
-		"""int_expression_plusminus : int_expression_muldiv
-		| int_expression_plusminus PLUS int_expression_muldiv
-		| int_expression_plusminus MINUS int_expression_muldiv
-		"""
-		
-		if len(p) > 2:
-			if p[2] == "+":
-				p[0] = ast.Add(left=p[1], right=p[3])
-			elif p[2] == "-":
-				p[0] = ast.Subtract(left=p[1], right=p[3])
-			else:
-				raise NotImplementedError(f"Unhandled binary operator: {p[2]}")
-		else:
-			p[0] = p[1]
-		
-		return p
-	
-	def p_int_expression_bitshift(self, p):
-		"""int_expression_bitshift : int_expression_plusminus
-		| int_expression_bitshift SHIFTLEFT int_expression_plusminus
-		| int_expression_bitshift SHIFTRIGHT int_expression_plusminus
-		"""
-		
-		if len(p) > 2:
-			if p[2] == "<<":
-				p[0] = ast.BitShiftLeft(left=p[1], right=p[3])
-			elif p[2] == ">>":
-				p[0] = ast.BitShiftRight(left=p[1], right=p[3])
-			else:
-				raise NotImplementedError(f"Unhandled binary operator: {p[2]}")
-		else:
-			p[0] = p[1]
-		
-		return p
-	
-	def p_int_expression_relational(self, p):
-		"""int_expression_relational : int_expression_bitshift
-		| int_expression_relational LESS int_expression_bitshift
-		| int_expression_relational GREATER int_expression_bitshift
-		| int_expression_relational LESSEQUAL int_expression_bitshift
-		| int_expression_relational GREATEREQUAL int_expression_bitshift
-		"""
-		
-		if len(p) > 2:
-			if p[2] == "<":
-				p[0] = ast.LessThan(left=p[1], right=p[3])
-			elif p[2] == ">":
-				p[0] = ast.GreaterThan(left=p[1], right=p[3])
-			elif p[2] == "<=":
-				p[0] = ast.LessThanEqual(left=p[1], right=p[3])
-			elif p[2] == ">=":
-				p[0] = ast.GreaterThanEqual(left=p[1], right=p[3])
-			else:
-				raise NotImplementedError(f"Unhandled binary operator: {p[2]}")
 		else:
 			p[0] = p[1]
-		
-		return p
 	
-	def p_int_expression_equal(self, p):
-		"""int_expression_equal : int_expression_relational
-		| int_expression_equal EQUAL int_expression_relational
-		| int_expression_equal NOTEQUAL int_expression_relational
-		"""
+	def p_int_expression_parenthesized(self, p):
+		"""int_expression : LPAREN int_expression RPAREN"""
 		
-		if len(p) > 2:
-			if p[2] == "==":
-				p[0] = ast.Equal(left=p[1], right=p[3])
-			elif p[2] == "!=":
-				p[0] = ast.NotEqual(left=p[1], right=p[3])
-			else:
-				raise NotImplementedError(f"Unhandled binary operator: {p[2]}")
-		else:
-			p[0] = p[1]
-		
-		return p
+		p[0] = p[2]
 	
-	def p_int_expression_bitand(self, p):
-		"""int_expression_bitand : int_expression_equal
-		| int_expression_bitand BITAND int_expression_equal
-		"""
-		
-		if len(p) > 2:
-			p[0] = ast.BitAnd(left=p[1], right=p[3])
-		else:
-			p[0] = p[1]
-		
-		return p
-	
-	def p_int_expression_bitxor(self, p):
-		"""int_expression_bitxor : int_expression_bitand
-		| int_expression_bitxor BITXOR int_expression_bitand
-		"""
-		
-		if len(p) > 2:
-			p[0] = ast.BitXor(left=p[1], right=p[3])
-		else:
-			p[0] = p[1]
-		
-		return p
-	
-	def p_int_expression_bitor(self, p):
-		"""int_expression_bitor : int_expression_bitxor
-		| int_expression_bitor BITOR int_expression_bitxor
-		"""
-		
-		if len(p) > 2:
-			p[0] = ast.BitOr(left=p[1], right=p[3])
-		else:
-			p[0] = p[1]
-		
-		return p
-	
-	def p_int_expression_booland(self, p):
-		"""int_expression_booland : int_expression_bitor
-		| int_expression_booland BOOLAND int_expression_bitor
+	def p_int_expression(self, p):
+		"""int_expression : MINUS int_expression %prec UNARY
+		| BOOLNOT int_expression %prec UNARY
+		| BITNOT int_expression %prec UNARY
+		| int_expression MULTIPLY int_expression
+		| int_expression DIVIDE int_expression
+		| int_expression MODULO int_expression
+		| int_expression PLUS int_expression
+		| int_expression MINUS int_expression
+		| int_expression SHIFTLEFT int_expression
+		| int_expression SHIFTRIGHT int_expression
+		| int_expression LESS int_expression
+		| int_expression GREATER int_expression
+		| int_expression LESSEQUAL int_expression
+		| int_expression GREATEREQUAL int_expression
+		| int_expression EQUAL int_expression
+		| int_expression NOTEQUAL int_expression
+		| int_expression BITAND int_expression
+		| int_expression BITXOR int_expression
+		| int_expression BITOR int_expression
+		| int_expression BOOLAND int_expression
+		| int_expression BOOLOR int_expression
 		"""
 		
-		if len(p) > 2:
-			p[0] = ast.BoolAnd(left=p[1], right=p[3])
+		if len(p) > 3:
+			p[0] = _BINARY_OPERATORS[p[2]](left=p[1], right=p[3])
 		else:
-			p[0] = p[1]
-		
-		return p
+			p[0] = _UNARY_OPERATORS[p[1]](value=p[2])
 	
-	def p_int_expression_boolor(self, p):
-		"""int_expression_boolor : int_expression_booland
-		| int_expression_boolor BOOLOR int_expression_booland
+	def p_varargs_part(self, p):
+		"""varargs_part : empty
+		| varargs_part COMMA int_expression
+		| varargs_part COMMA string_expression
 		"""
 		
+		# The list is always freshly created by the empty rule, so it can be extended in place.
 		if len(p) > 2:
-			p[0] = ast.BoolOr(left=p[1], right=p[3])
-		else:
-			p[0] = p[1]
-		
-		return p
-	
-	def p_int_expression(self, p):
-		"""int_expression : int_expression_boolor"""
-		
-		p[0] = p[1]
-		return p
-	
-	def p_expression(self, p):
-		"""expression : int_expression
-		| string_expression
-		"""
+			p[1].append(p[3])
 		
 		p[0] = p[1]
-		return p
-	
-	def p_varargs_part(self, p):
-		"""varargs_part : empty
-		| varargs_part COMMA expression
-		"""
-		
-		p[0] = p[1] + p[3:]
-		return p
 	
 	def p_varargs_opt(self, p):
 		"""varargs_opt : varargs_part comma_opt"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_string_function_call(self, p):
 		"""string_function_call : FUN_DATE
@@ -486,27 +643,7 @@ class RezParser(object):
 		| FUN_VERSION
 		"""
 		
-		name = p[1].lower()[2:]
-		if name == "date":
-			p[0] = ast.FunDate()
-		elif name == "format":
-			p[0] = ast.FunFormat(format=p[3], args=p[4])
-		elif name == "name":
-			p[0] = ast.FunName()
-		elif name == "read":
-			p[0] = ast.FunRead(path=p[3])
-		elif name == "resource":
-			p[0] = ast.FunResource(path=p[3], type=p[5], id=p[7], name=p[9])
-		elif name == "shell":
-			p[0] = ast.FunShell(name=p[3])
-		elif name == "time":
-			p[0] = ast.FunTime()
-		elif name == "version":
-			p[0] = ast.FunVersion()
-		else:
-			raise NotImplementedError(f"Unhandled string function: {name}")
-		
-		return p
+		p[0] = _FUNCTION_CALLS[p.slice[1].type](p)
 	
 	def p_single_string(self, p):
 		"""single_string : STRINGLIT_TEXT
@@ -514,19 +651,22 @@ class RezParser(object):
 		| string_function_call
 		"""
 		
-		if isinstance(p[1], str):
-			if p[1].startswith("$"):
-				p[0] = ast.StringLiteral(value=bytes.fromhex(p[1][2:-1]))
-			else:
-				try:
-					unescaped = _unescape_string(p[1][1:-1])
-				except ValueError as e:
-					raise ParseError(str(e), filename=p[-1].lexer.filename, lineno=p[-1].lineno)
-				p[0] = ast.StringLiteral(value=unescaped)
+		if isinstance(p[1], bytes):
+			# Hex string literals are already decoded by the lexer.
+			p[0] = ast.StringLiteral(value=p[1])
+		elif isinstance(p[1], str):
+			# Text string literals are encoded here and not in the lexer, so that characters that can't be encoded are only an error in strings that are actually parsed (not in inactive preprocessor blocks), and are reported with a location. (UnicodeEncodeError is a subclass of ValueError.)
+			# Tokens that didn't come directly from the lexer might not say whether they contain escapes, so these are always unescaped.
+			try:
+				if getattr(p.slice[1], "stringlit_escapes", True):
+					value = _unescape_string(p[1][1:-1])
+				else:
+					value = p[1][1:-1].encode(common.STRING_ENCODING)
+			except ValueError as e:
+				raise ParseError(str(e), filename=p.lexer.filename, lineno=p.lexer.lineno)
+			p[0] = ast.StringLiteral(value=value)
 		else:
 			p[0] = p[1]
-		
-		return p
 	
 	def p_string_expression_part(self, p):
 		"""string_expression_part : single_string
@@ -534,11 +674,10 @@ class RezParser(object):
 		"""
 		
 		if len(p) > 2:
-			p[0] = p[1] + [p[2]]
+			p[1].append(p[2])
+			p[0] = p[1]
 		else:
 			p[0] = [p[1]]
-		
-		return p
 	
 	def p_string_expression(self, p):
 		"""string_expression : string_expression_part"""
@@ -547,8 +686,6 @@ class RezParser(object):
 			p[0] = p[1][0]
 		else:
 			p[0] = ast.StringConcat(values=p[1])
-		
-		return p
 	
 	def p_string_expression_opt(self, p):
 		"""string_expression_opt : empty
@@ -556,7 +693,6 @@ class RezParser(object):
 		"""
 		
 		p[0] = p[1] or None
-		return p
 	
 	def p_resource_name_opt(self, p):
 		"""resource_name_opt : empty
@@ -567,16 +703,17 @@ class RezParser(object):
 			p[0] = p[2]
 		else:
 			p[0] = None
-		
-		return p
 	
 	def p_resource_attributes_named(self, p):
 		"""resource_attributes_named : resource_attribute
 		| resource_attributes_named COMMA resource_attribute
 		"""
 		
-		p[0] = [p[1]] if len(p) == 2 else p[1] + p[3:]
-		return p
+		if len(p) > 2:
+			p[1].append(p[3])
+			p[0] = p[1]
+		else:
+			p[0] = [p[1]]
 	
 	def p_resource_attributes(self, p):
 		"""resource_attributes : resource_attributes_named
@@ -584,7 +721,6 @@ class RezParser(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_resource_attributes_opt(self, p):
 		"""resource_attributes_opt : empty
@@ -595,27 +731,35 @@ class RezParser(object):
 			p[0] = p[2]
 		else:
 			p[0] = []
+	
+	def p_resource_id_range_end_opt(self, p):
+		"""resource_id_range_end_opt : empty
+		| COLON int_expression
+		"""
 		
-		return p
+		if len(p) > 2:
+			p[0] = p[2]
+		else:
+			p[0] = None
 	
-	def p_resource_id_range(self, p):
-		"""resource_id_range : int_expression COLON int_expression"""
+	def p_resource_id_or_range(self, p):
+		"""resource_id_or_range : int_expression resource_id_range_end_opt"""
 		
-		p[0] = ast.IDRange(begin=p[1], end=p[3])
-		return p
+		# A single ID and an ID range start with the same expression, so they are parsed as one rule with an optional range end, instead of two rules that the parser would have to track separately.
+		if p[2] is None:
+			p[0] = p[1]
+		else:
+			p[0] = ast.IDRange(begin=p[1], end=p[2])
 	
 	def p_resource_spec_typedef(self, p):
 		"""resource_spec_typedef : int_expression
-		| int_expression LPAREN int_expression RPAREN
-		| int_expression LPAREN resource_id_range RPAREN
+		| int_expression LPAREN resource_id_or_range RPAREN
 		"""
 		
 		if len(p) > 2:
 			p[0] = ast.ResourceSpecTypeDef(type=p[1], id=p[3])
 		else:
 			p[0] = ast.ResourceSpecTypeDef(type=p[1], id=None)
-		
-		return p
 	
 	def p_resource_spec_typeuse(self, p):
 		"""resource_spec_typeuse : int_expression
@@ -626,19 +770,15 @@ class RezParser(object):
 			p[0] = ast.ResourceSpecTypeUse(type=p[1], id=p[3])
 		else:
 			p[0] = ast.ResourceSpecTypeUse(type=p[1], id=None)
-		
-		return p
 	
 	def p_resource_spec_def(self, p):
 		"""resource_spec_def : int_expression LPAREN int_expression resource_name_opt resource_attributes_opt RPAREN"""
 		
 		p[0] = ast.ResourceSpecDef(type=p[1], id=p[3], name=p[4], attributes=p[5])
-		return p
 	
 	def p_resource_spec_use(self, p):
 		"""resource_spec_use : int_expression
-		| int_expression LPAREN int_expression RPAREN
-		| int_expression LPAREN resource_id_range RPAREN
+		| int_expression LPAREN resource_id_or_range RPAREN
 		| int_expression LPAREN string_expression RPAREN
 		"""
 		
@@ -646,26 +786,21 @@ class RezParser(object):
 			p[0] = ast.ResourceSpecUse(type=p[1], id_or_name=p[3])
 		else:
 			p[0] = ast.ResourceSpecUse(type=p[1], id_or_name=None)
-		
-		return p
 	
 	def p_change_statement(self, p):
 		"""change_statement : CHANGE resource_spec_use TO resource_spec_def SEMICOLON"""
 		
 		p[0] = ast.Change(from_spec=p[2], to_spec=p[4])
-		return p
 	
 	def p_data_statement(self, p):
 		"""data_statement : DATA resource_spec_def LBRACE string_expression_opt semicolon_opt RBRACE SEMICOLON"""
 		
 		p[0] = ast.Data(spec=p[2], value=p[4])
-		return p
 	
 	def p_delete_statement(self, p):
 		"""delete_statement : DELETE resource_spec_use SEMICOLON"""
 		
 		p[0] = ast.Delete(spec=p[2])
-		return p
 	
 	def p_enum_constant(self, p):
 		"""enum_constant : IDENTIFIER
@@ -676,8 +811,6 @@ class RezParser(object):
 			p[0] = ast.EnumConstant(name=p[1], value=p[3])
 		else:
 			p[0] = ast.EnumConstant(name=p[1], value=None)
-		
-		return p
 	
 	def p_enum_constants(self, p):
 		"""enum_constants : enum_constant
@@ -685,11 +818,10 @@ class RezParser(object):
 		"""
 		
 		if len(p) > 3:
-			p[0] = p[1] + [p[3]]
+			p[1].append(p[3])
+			p[0] = p[1]
 		else:
 			p[0] = [p[1]]
-		
-		return p
 	
 	def p_enum_body(self, p):
 		"""enum_body : empty
@@ -697,7 +829,6 @@ class RezParser(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_enum_statement(self, p):
 		"""enum_statement : ENUM LBRACE enum_body RBRACE SEMICOLON
@@ -708,8 +839,6 @@ class RezParser(object):
 			p[0] = ast.Enum(name=p[2], constants=p[4])
 		else:
 			p[0] = ast.Enum(name=None, constants=p[3])
-		
-		return p
 	
 	def p_include_statement(self, p):
 		"""include_statement : INCLUDE string_expression SEMICOLON
@@ -727,18 +856,16 @@ class RezParser(object):
 			p[0] = ast.Include(path=p[2], from_spec=p[3], to_spec=None)
 		else:
 			p[0] = ast.Include(path=p[2], from_spec=None, to_spec=None)
-		
-		return p
 	
 	def p_read_statement(self, p):
 		"""read_statement : READ resource_spec_def string_expression SEMICOLON"""
 		
 		p[0] = ast.Read(spec=p[2], path=p[3])
-		return p
 	
 	def p_resource_value(self, p):
 		"""resource_value : IDENTIFIER
-		| expression
+		| int_expression
+		| string_expression
 		| LBRACE array_values RBRACE
 		| IDENTIFIER LBRACE resource_values semicolon_opt RBRACE
 		"""
@@ -751,8 +878,6 @@ class RezParser(object):
 			p[0] = ast.Symbol(name=p[1])
 		else:
 			p[0] = p[1]
-		
-		return p
 	
 	def p_resource_values_part(self, p):
 		"""resource_values_part : resource_value
@@ -760,11 +885,10 @@ class RezParser(object):
 		"""
 		
 		if len(p) > 3:
-			p[0] = p[1] + [p[3]]
+			p[1].append(p[3])
+			p[0] = p[1]
 		else:
 			p[0] = [p[1]]
-		
-		return p
 	
 	def p_resource_values(self, p):
 		"""resource_values : empty
@@ -772,7 +896,6 @@ class RezParser(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_array_values_part(self, p):
 		"""array_values_part : resource_values
@@ -780,11 +903,10 @@ class RezParser(object):
 		"""
 		
 		if len(p) > 2:
-			p[0] = p[1] + [p[3]]
+			p[1].append(p[3])
+			p[0] = p[1]
 		else:
 			p[0] = [p[1]]
-		
-		return p
 	
 	def p_array_values(self, p):
 		"""array_values : empty
@@ -792,34 +914,21 @@ class RezParser(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_resource_statement(self, p):
 		"""resource_statement : RESOURCE resource_spec_def LBRACE resource_values semicolon_opt RBRACE SEMICOLON"""
 		
 		p[0] = ast.Resource(spec=p[2], values=p[4])
-		return p
-	
-	def p_simple_field_modifier(self, p):
-		"""simple_field_modifier : KEY
-		| UNSIGNED
-		| BINARY
-		| OCTAL
-		| DECIMAL
-		| HEX
-		| LITERAL
-		"""
-		
-		p[0] = p[1]
-		return p
 	
 	def p_simple_field_modifiers_opt(self, p):
 		"""simple_field_modifiers_opt : empty
-		| simple_field_modifiers_opt simple_field_modifier
+		| simple_field_modifiers_opt SIMPLE_FIELD_MODIFIER
 		"""
 		
-		p[0] = p[1] + p[2:]
-		return p
+		if len(p) > 2:
+			p[1].append(p[2])
+		
+		p[0] = p[1]
 	
 	def p_numeric_type(self, p):
 		"""numeric_type : BITSTRING LBRACKET int_expression RBRACKET
@@ -833,30 +942,16 @@ class RezParser(object):
 			p[0] = (p[1], p[3])
 		else:
 			p[0] = (p[1], None)
-		
-		return p
-	
-	def p_string_type_name(self, p):
-		"""string_type_name : STRING
-		| CSTRING
-		| PSTRING
-		| WSTRING
-		"""
-		
-		p[0] = p[1]
-		return p
 	
 	def p_string_type(self, p):
-		"""string_type : string_type_name
-		| string_type_name LBRACKET int_expression RBRACKET
+		"""string_type : STRING_TYPE_NAME
+		| STRING_TYPE_NAME LBRACKET int_expression RBRACKET
 		"""
 		
 		if len(p) > 4:
 			p[0] = (p[1], p[3])
 		else:
 			p[0] = (p[1], None)
-		
-		return p
 	
 	def p_simple_type(self, p):
 		"""simple_type : BOOLEAN
@@ -871,8 +966,6 @@ class RezParser(object):
 			p[0] = (p[1], None)
 		else:
 			p[0] = p[1]
-		
-		return p
 	
 	def p_symbolic_constant(self, p):
 		"""symbolic_constant : IDENTIFIER
@@ -883,22 +976,23 @@ class RezParser(object):
 			p[0] = ast.SymbolicConstant(name=p[1], value=p[3])
 		else:
 			p[0] = ast.SymbolicConstant(name=p[1], value=None)
-		
-		return p
 	
 	def p_symbolic_constants_part(self, p):
 		"""symbolic_constants_part : empty symbolic_constant
 		| symbolic_constants_part COMMA symbolic_constant
 		"""
 		
-		p[0] = p[1] + p[3:]
-		return p
+		if len(p) > 3:
+			p[1].append(p[3])
+		else:
+			p[1].append(p[2])
+		
+		p[0] = p[1]
 	
 	def p_symbolic_constants(self, p):
 		"""symbolic_constants : symbolic_constants_part comma_opt"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_simple_field(self, p):
 		"""simple_field : simple_type SEMICOLON
@@ -912,8 +1006,6 @@ class RezParser(object):
 			p[0] = (p[1], p[2])
 		else:
 			p[0] = (p[1], None)
-		
-		return p
 	
 	def p_fill_field_size(self, p):
 		"""fill_field_size : BIT
@@ -924,7 +1016,6 @@ class RezParser(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_fill_field(self, p):
 		"""fill_field : FILL fill_field_size SEMICOLON
@@ -935,8 +1026,6 @@ class RezParser(object):
 			p[0] = ast.FillField(type=ast.FillField.Type[p[2].lower()], count=p[4])
 		else:
 			p[0] = ast.FillField(type=ast.FillField.Type[p[2].lower()], count=None)
-		
-		return p
 	
 	def p_align_field_size(self, p):
 		"""align_field_size : NIBBLE
@@ -946,28 +1035,26 @@ class RezParser(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_align_field(self, p):
 		"""align_field : ALIGN align_field_size SEMICOLON"""
 		
 		p[0] = ast.AlignField(type=ast.AlignField.Type[p[2].lower()])
-		
-		return p
 	
 	def p_array_modifier(self, p):
 		"""array_modifier : WIDE"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_array_modifiers_opt(self, p):
 		"""array_modifiers_opt : empty
 		| array_modifiers_opt array_modifier
 		"""
 		
-		p[0] = p[1] + p[2:]
-		return p
+		if len(p) > 2:
+			p[1].append(p[2])
+		
+		p[0] = p[1]
 	
 	def p_array_field(self, p):
 		"""array_field : array_modifiers_opt ARRAY LBRACE fields RBRACE SEMICOLON
@@ -980,13 +1067,13 @@ class RezParser(object):
 		for mod in p[1]:
 			mod = mod.lower()
 			if mod in seen:
-				raise ParseError(f"Duplicate attribute {mod!r}", filename=p[-1].lexer.filename, lineno=p[-1].lineno)
+				raise ParseError(f"Duplicate attribute {mod!r}", filename=p.lexer.filename, lineno=p.lexer.lineno)
 			seen.add(mod)
 			
 			if mod == "wide":
 				wide = True
 			else:
-				raise ParseError(f"Unsupported modifier {mod!r} for type array", filename=p[-1].lexer.filename, lineno=p[-1].lineno)
+				raise ParseError(f"Unsupported modifier {mod!r} for type array", filename=p.lexer.filename, lineno=p.lexer.lineno)
 		
 		if len(p) > 9:
 			p[0] = ast.ArrayField(wide=wide, label=None, count=p[4], fields=p[7])
@@ -994,28 +1081,26 @@ class RezParser(object):
 			p[0] = ast.ArrayField(wide=wide, label=p[3], count=None, fields=p[5])
 		else:
 			p[0] = ast.ArrayField(wide=wide, label=None, count=None, fields=p[4])
-		
-		return p
 	
 	def p_switch_field_case(self, p):
 		"""switch_field_case : CASE IDENTIFIER COLON fields"""
 		
 		p[0] = ast.SwitchCase(label=p[2], fields=p[4])
-		return p
 	
 	def p_switch_field_cases(self, p):
 		"""switch_field_cases : empty
 		| switch_field_cases switch_field_case
 		"""
 		
-		p[0] = p[1] + p[2:]
-		return p
+		if len(p) > 2:
+			p[1].append(p[2])
+		
+		p[0] = p[1]
 	
 	def p_switch_field(self, p):
 		"""switch_field : SWITCH LBRACE switch_field_cases RBRACE SEMICOLON"""
 		
 		p[0] = ast.Switch(cases=p[3])
-		return p
 	
 	def p_field(self, p):
 		"""field : SEMICOLON
@@ -1046,56 +1131,39 @@ class RezParser(object):
 				for mod in modifiers:
 					mod = mod.lower()
 					if mod in seen:
-						raise ParseError(f"Duplicate attribute {mod!r}", filename=p[-1].lexer.filename, lineno=p[-1].lineno)
+						raise ParseError(f"Duplicate attribute {mod!r}", filename=p.lexer.filename, lineno=p.lexer.lineno)
 					seen.add(mod)
 					
 					if mod == "key":
 						is_key = True
 					elif mod == "unsigned":
-						if typename not in ("bitstring", "byte", "integer", "longint"):
-							raise ParseError(f"Unsupported modifier {mod!r} for type {typename!r}", filename=p[-1].lexer.filename, lineno=p[-1].lineno)
+						if typename not in _NUMERIC_TYPE_NAMES:
+							raise ParseError(f"Unsupported modifier {mod!r} for type {typename!r}", filename=p.lexer.filename, lineno=p.lexer.lineno)
 						
 						signed = False
-					elif mod in ("binary", "octal", "decimal", "hex", "literal"):
+					elif mod in _BASE_MODIFIERS:
 						if mod == "hex" and typename == "string":
 							# Special case: hex is allowed on string
 							pass
-						elif typename not in ("bitstring", "byte", "integer", "longint"):
-							raise ParseError(f"Unsupported modifier {mod!r} for type {typename!r}", filename=p[-1].lexer.filename, lineno=p[-1].lineno)
+						elif typename not in _NUMERIC_TYPE_NAMES:
+							raise ParseError(f"Unsupported modifier {mod!r} for type {typename!r}", filename=p.lexer.filename, lineno=p.lexer.lineno)
 						
 						if base is None:
 							base = mod
 						else:
-							raise ParseError(f"Duplicate base modifier {mod!r} (base was previously set to {base!r}", filename=p[-1].lexer.filename, lineno=p[-1].lineno)
+							raise ParseError(f"Duplicate base modifier {mod!r} (base was previously set to {base!r}", filename=p.lexer.filename, lineno=p.lexer.lineno)
 					else:
-						raise ParseError(f"Invalid modifier: {mod!r}", filename=p[-1].lexer.filename, lineno=p[-1].lineno)
+						raise ParseError(f"Invalid modifier: {mod!r}", filename=p.lexer.filename, lineno=p.lexer.lineno)
 				
 				if typename == "int":
 					typename = "integer"
 				
-				if typename == "boolean":
-					fieldtype = ast.BooleanFieldType()
-				elif typename in ("bitstring", "byte", "integer", "longint"):
-					fieldtype = ast.NumericFieldType(
-						signed=signed,
-						base=ast.NumericFieldType.Base[base or "decimal"],
-						type=ast.NumericFieldType.Type[typename],
-						size=size,
-					)
-				elif typename == "char":
-					fieldtype = ast.CharFieldType()
-				elif typename in ("string", "cstring", "pstring", "wstring"):
-					fieldtype = ast.StringFieldType(
-						format=ast.StringFieldType.Format[base or "literal"],
-						type=ast.StringFieldType.Type[typename],
-						length=size,
-					)
-				elif typename == "point":
-					fieldtype = ast.PointFieldType()
-				elif typename == "rect":
-					fieldtype = ast.RectFieldType()
-				else:
-					raise ParseError(f"Unknown field type {typename!r}", filename=p[-1].lexer.filename, lineno=p[-1].lineno)
+				try:
+					build_fieldtype = _FIELD_TYPE_BUILDERS[typename]
+				except KeyError:
+					raise ParseError(f"Unknown field type {typename!r}", filename=p.lexer.filename, lineno=p.lexer.lineno)
+				
+				fieldtype = build_fieldtype(typename, size, signed, base)
 				
 				if value_or_symconsts is None:
 					value = None
@@ -1119,8 +1187,6 @@ class RezParser(object):
 		else:
 			# Anything else (fill, align, array, switch) can be passed through as-is.
 			p[0] = p[1]
-		
-		return p
 	
 	def p_fields(self, p):
 		"""fields : empty
@@ -1128,11 +1194,10 @@ class RezParser(object):
 		"""
 		
 		if len(p) > 2 and p[2]:
-			p[0] = p[1] + [p[2]]
+			p[1].append(p[2])
+			p[0] = p[1]
 		else:
 			p[0] = p[1]
-		
-		return p
 	
 	def p_type_statement(self, p):
 		"""type_statement : TYPE resource_spec_typedef LBRACE fields RBRACE SEMICOLON
@@ -1143,8 +1208,6 @@ class RezParser(object):
 			p[0] = ast.Type(spec=p[2], fields=p[4], from_spec=None)
 		else:
 			p[0] = ast.Type(spec=p[2], fields=None, from_spec=p[4])
-		
-		return p
 	
 	def p_statement(self, p):
 		"""statement : SEMICOLON
@@ -1162,8 +1225,6 @@ class RezParser(object):
 			p[0] = None
 		else:
 			p[0] = p[1]
-		
-		return p
 	
 	def p_file_part(self, p):
 		"""file_part : empty
@@ -1171,36 +1232,131 @@ class RezParser(object):
 		"""
 		
 		if len(p) > 2 and p[2]:
-			p[0] = p[1] + [p[2]]
+			if self.statement_callback is None:
+				p[1].append(p[2])
+				p[0] = p[1]
+			else:
+				# Statements are passed to the callback and not collected, see parse_file_statements.
+				self.statement_callback(p[2])
+				p[0] = p[1]
 		else:
 			p[0] = p[1]
+	
+	def p_start(self, p):
+		"""start : PARSE_FILE start_file
+		| PARSE_EXPR start_expr
+		"""
 		
-		return p
+		p[0] = p[2]
 	
 	def p_start_file(self, p):
 		"""start_file : file_part"""
 		
 		p[0] = ast.File(statements=p[1])
-		return p
 	
 	def p_start_expr(self, p):
-		"""start_expr : expression"""
+		"""start_expr : int_expression
+		| string_expression
+		"""
 		
 		p[0] = p[1]
-		return p
 	
-	def __init__(self, **kwargs):
+	def __init__(self, *, memoize=False, **kwargs):
 		super().__init__()
 		
-		self.parser_file = ply.yacc.yacc(module=self, start="start_file", tabmodule="_table_parser_file", debugfile="_debug_parser_file.out", **kwargs)
-		self.parser_expr = ply.yacc.yacc(module=self, start="start_expr", tabmodule="_table_parser_expr", debugfile="_debug_parser_expr.out", **kwargs)
-		self.parser_file.parse("", lexer.RezLexer())
-		self.parser_expr.parse("0", lexer.RezLexer())
+		# Callable that is called with every top-level statement as soon as it is parsed, or None to collect all statements into the resulting ast.File.
+		self.statement_callback = None
+		
+		# Mapping of inputs previously passed to parse_expr to the resulting ASTs, in least recently used order, or None if memoization is disabled.
+		# The preprocessor parses many short and often identical expressions (#if conditions, enum values, #printf arguments), which can be looked up here instead of being parsed again. The cached ASTs are shared between all parse_expr calls with the same input, and should not be modified.
+		self.expr_cache = collections.OrderedDict() if memoize else None
+		
+		# The NoOpLexer that puts the start token in front of the input of every parse, or None while it is being used. See _parse.
+		self.start_lexer = lexer.NoOpLexer()
+		
+		# PLY reads every attribute listed by dir(self) while collecting the grammar, including all slots, so the parser slot must already be set at that point.
+		self.parser = None
+		self.parser = _build_parser(self, "parser", **kwargs)
+	
+	def _parse(self, start_token_type, inp, lex, **kwargs):
+		if inp is not None:
+			lex.input(inp)
+		
+		# Put the start token in front of the lexer's tokens. The input (if any) has already been passed to the lexer, so the parser must not do so again.
+		# The same start lexer is reused for every parse, except when a parse is started while another one is still running (the preprocessor parses expressions while it is read by parse_file), which needs a separate one.
+		start_lexer = self.start_lexer
+		if start_lexer is None:
+			start_lexer = lexer.NoOpLexer()
+		self.start_lexer = None
+		
+		start_lexer.lexer = lex
+		start_lexer.input((common.Token(start_token_type),))
+		try:
+			return self.parser.parse(None, start_lexer, **kwargs)
+		except _UnexpectedEnd:
+			raise ParseError("Unexpected end of input", filename=start_lexer.filename, lineno=start_lexer.lineno) from None
+		finally:
+			# PLY reduces values off its stacks as it goes, but keeps the stacks themselves (which at the end contain the finished AST, or after an error, all partially parsed values) until the next parse. Clear them so that the parser doesn't keep the last parse result alive.
+			del self.parser.symstack[:]
+			del self.parser.statestack[:]
+			
+			# Don't keep the lexer (or any tokens left over after an error) alive until the next parse.
+			start_lexer.lexer = None
+			start_lexer.input(())
+			self.start_lexer = start_lexer
 	
 	def parse_file(self, inp, lexer, **kwargs):
-		self.parser_file.restart()
-		return self.parser_file.parse(inp, lexer, **kwargs)
+		return self._parse("PARSE_FILE", inp, lexer, **kwargs)
+	
+	def parse_file_statements(self, inp, lexer, callback, **kwargs):
+		"""Parse a file like parse_file, but pass each top-level statement to callback as soon as it has been parsed, instead of collecting all statements in memory.
+		The ast.File returned at the end has an empty statements list.
+		"""
+		
+		self.statement_callback = callback
+		try:
+			return self.parse_file(inp, lexer, **kwargs)
+		finally:
+			self.statement_callback = None
+	
+	def _parse_expr(self, inp, lex, **kwargs):
+		# Token lists (as passed by the preprocessor) are first given to the much faster _IntExpressionReader, which handles most simple int expressions. Everything else is parsed using the full grammar.
+		if not kwargs and inp is not None and not isinstance(inp, str):
+			inp = list(inp)
+			try:
+				return _IntExpressionReader(inp).read()
+			except _UnsupportedExpression:
+				pass
+		
+		return self._parse("PARSE_EXPR", inp, lex, **kwargs)
 	
 	def parse_expr(self, inp, lexer, **kwargs):
-		self.parser_expr.restart()
-		return self.parser_expr.parse(inp, lexer, **kwargs)
+		if self.expr_cache is None or inp is None:
+			return self._parse_expr(inp, lexer, **kwargs)
+		
+		if isinstance(inp, str):
+			key = inp
+		else:
+			inp = list(inp)
+			key = tuple((tok.type, tok.value) for tok in inp)
+		
+		try:
+			expr = self.expr_cache[key]
+		except KeyError:
+			expr = self._parse_expr(inp, lexer, **kwargs)
+			self.expr_cache[key] = expr
+			if len(self.expr_cache) > _EXPR_CACHE_SIZE:
+				self.expr_cache.popitem(last=False)
+		else:
+			self.expr_cache.move_to_end(key)
+		
+		return expr
+
+
+# Mapping of binary operator token types to their precedence (higher numbers bind more tightly), for _IntExpressionReader. This is derived from RezParser.precedence, so that the reader always groups operators the same way as the grammar. Only left-associative levels are included - the reader handles no other kind of binary operator, so it leaves expressions with any other operator to the grammar.
+_BINARY_PRECEDENCE = {
+	token_type: level
+	for level, (associativity, *token_types) in enumerate(RezParser.precedence, 1)
+	if associativity == "left"
+	for token_type in token_types
+}
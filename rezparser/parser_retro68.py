@@ -1,9 +1,24 @@
-import ply.yacc
-
 from . import lexer
 from . import parser
 
 
+# The lexer groups some keywords that the Retro68 grammar does not know. Tokens of these groups with any other keyword are rejected by the grammar actions.
+_STRING_TYPE_NAMES = frozenset({"pstring", "wstring", "string"})
+_RESOURCE_ATTRIBUTES = frozenset({
+	"compressed", "uncompressed",
+	"changed", "unchanged",
+	"preload", "nonpreload",
+	"locked", "unlocked",
+	"purgeable", "nonpurgeable",
+	"sysheap", "appheap",
+})
+
+
+def _default_lexer():
+	# Defined outside of the class, because RezParserRetro68.__init__'s lexer parameter shadows the lexer module.
+	return lexer.RezLexer().lexer
+
+
 # noinspection PyMethodMayBeStatic, PyPep8Naming
 class RezParserRetro68(object):
 	"""(Not fully functional) Rez parser, using rules based on the Retro68 Rez tool's Yacc source:
@@ -14,6 +29,19 @@ class RezParserRetro68(object):
 	
 	start = "rez"
 	
+	# Operator precedence and associativity for expressions, from lowest to highest precedence. This follows the levels of the original grammar, which used a separate rule for each level.
+	# UNARY is not a real token, it is only used as the precedence of the unary operator rules (because MINUS and PLUS are also binary operators with lower precedence).
+	precedence = (
+		("left", "BITXOR"),
+		("left", "BITAND"),
+		("left", "BITOR"),
+		("left", "EQUAL", "NOTEQUAL"),
+		("left", "SHIFTLEFT", "SHIFTRIGHT"),
+		("left", "PLUS", "MINUS"),
+		("left", "MULTIPLY", "DIVIDE"),
+		("right", "UNARY"),
+	)
+	
 	def p_error(self, p):
 		raise parser.ParseError(p)
 	
@@ -21,7 +49,6 @@ class RezParserRetro68(object):
 		"""empty : """
 		
 		p[0] = []
-		return p
 	
 	def p_rez(self, p):
 		"""rez : empty
@@ -30,8 +57,10 @@ class RezParserRetro68(object):
 		| rez data SEMICOLON
 		"""
 		
-		p[0] = p[1] + p[2:-1]
-		return p
+		if len(p) > 3:
+			p[1].append(p[2])
+		
+		p[0] = p[1]
 	
 	def p_type_definition(self, p):
 		"""type_definition : TYPE type_spec LBRACE field_definitions RBRACE
@@ -39,13 +68,11 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[2], p[4]
-		return p
 	
 	def p_res_type(self, p):
 		"""res_type : INTLIT"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_type_spec(self, p):
 		"""type_spec : res_type
@@ -53,7 +80,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1], (None if len(p) <= 3 else p[3])
-		return p
 	
 	def p_field_definitions(self, p):
 		"""field_definitions : empty
@@ -62,8 +88,10 @@ class RezParserRetro68(object):
 		| field_definitions field_definition SEMICOLON
 		"""
 		
-		p[0] = p[1] + p[2:-1]
-		return p
+		if len(p) > 3:
+			p[1].append(p[2])
+		
+		p[0] = p[1]
 	
 	def p_field_definition(self, p):
 		"""field_definition : simple_field_definition
@@ -74,7 +102,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_simple_field_definition(self, p):
 		"""simple_field_definition : field_attributes simpletype array_count_opt value_spec_opt
@@ -85,7 +112,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_value_spec_opt(self, p):
 		"""value_spec_opt : empty
@@ -93,7 +119,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_simpletype(self, p):
 		"""simpletype : BOOLEAN
@@ -103,26 +128,24 @@ class RezParserRetro68(object):
 		| RECT
 		| POINT
 		| CHAR
-		| PSTRING
-		| WSTRING
-		| STRING
+		| STRING_TYPE_NAME
 		| BITSTRING
 		"""
 		
+		if p.slice[1].type == "STRING_TYPE_NAME" and p[1].lower() not in _STRING_TYPE_NAMES:
+			raise parser.ParseError(p.slice[1])
+		
 		p[0] = p[1]
-		return p
 	
 	def p_fill_statement(self, p):
 		"""fill_statement : FILL fill_unit array_count_opt"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_align_statement(self, p):
 		"""align_statement : ALIGN fill_unit"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_fill_unit(self, p):
 		"""fill_unit : BIT
@@ -133,19 +156,16 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_array_definition(self, p):
 		"""array_definition : array_attributes ARRAY array_name_opt array_count_opt LBRACE field_definitions RBRACE"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_array_count(self, p):
 		"""array_count : LBRACKET expression RBRACKET"""
 		
 		p[0] = p[2]
-		return p
 	
 	def p_array_count_opt(self, p):
 		"""array_count_opt : empty
@@ -153,7 +173,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_array_name_opt(self, p):
 		"""array_name_opt : empty
@@ -161,7 +180,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_array_attributes(self, p):
 		"""array_attributes : empty
@@ -169,48 +187,41 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_field_attributes(self, p):
 		"""field_attributes : empty
 		| field_attributes field_attribute
 		"""
 		
-		p[0] = p[1] + p[2:]
-		return p
+		if len(p) > 2:
+			p[1].append(p[2])
+		
+		p[0] = p[1]
 	
 	def p_field_attribute(self, p):
-		"""field_attribute : HEX
-		| DECIMAL
-		| OCTAL
-		| BINARY
-		| KEY
-		| UNSIGNED
-		| LITERAL
-		"""
+		"""field_attribute : SIMPLE_FIELD_MODIFIER"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_switch_definition(self, p):
 		"""switch_definition : SWITCH LBRACE switch_cases RBRACE"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_switch_cases(self, p):
 		"""switch_cases : empty
 		| switch_cases switch_case
 		"""
 		
-		p[0] = p[1] + p[2:]
-		return p
+		if len(p) > 2:
+			p[1].append(p[2])
+		
+		p[0] = p[1]
 	
 	def p_switch_case(self, p):
 		"""switch_case : CASE IDENTIFIER COLON"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_value(self, p):
 		"""value : expression
@@ -219,80 +230,32 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_expression(self, p):
-		"""expression : expression1
-		| expression BITXOR expression1
-		"""
-		
-		p[0] = p[1:]
-		return p
-	
-	def p_expression1(self, p):
-		"""expression1 : expression2
-		| expression1 BITAND expression2
-		"""
-		
-		p[0] = p[1:]
-		return p
-	
-	def p_expression2(self, p):
-		"""expression2 : expression3
-		| expression2 BITOR expression3
-		"""
-		
-		p[0] = p[1:]
-		return p
-	
-	def p_expression3(self, p):
-		"""expression3 : expression4
-		| expression3 EQUAL expression4
-		| expression3 NOTEQUAL expression4
-		"""
-		
-		p[0] = p[1:]
-		return p
-	
-	def p_expression4(self, p):
-		"""expression4 : expression5
-		| expression4 SHIFTLEFT expression5
-		| expression4 SHIFTRIGHT expression5
-		"""
-		
-		p[0] = p[1:]
-		return p
-	
-	def p_expression5(self, p):
-		"""expression5 : expression6
-		| expression5 PLUS expression6
-		| expression5 MINUS expression6
-		"""
-		
-		p[0] = p[1:]
-		return p
-	
-	def p_expression6(self, p):
-		"""expression6 : expression7
-		| expression6 MULTIPLY expression7
-		| expression6 DIVIDE expression7
-		"""
-		
-		p[0] = p[1:]
-		return p
-	
-	def p_expression7(self, p):
-		"""expression7 : expression8
-		| MINUS expression7
-		| PLUS expression7
-		| BITCOMPL expression7
-		"""
-		
-		p[0] = p[1:]
-		return p
-	
-	def p_expression8(self, p):
-		"""expression8 : INTLIT
+		"""expression : expression_operand
+		| expression BITXOR expression
+		| expression BITAND expression
+		| expression BITOR expression
+		| expression EQUAL expression
+		| expression NOTEQUAL expression
+		| expression SHIFTLEFT expression
+		| expression SHIFTRIGHT expression
+		| expression PLUS expression
+		| expression MINUS expression
+		| expression MULTIPLY expression
+		| expression DIVIDE expression
+		| MINUS expression %prec UNARY
+		| PLUS expression %prec UNARY
+		| BITNOT expression %prec UNARY
+		"""
+		
+		if len(p) > 2:
+			p[0] = p[1:]
+		else:
+			p[0] = p[1]
+	
+	def p_expression_operand(self, p):
+		"""expression_operand : INTLIT
 		| identifier_expression
 		| LPAREN expression RPAREN
 		| FUN_COUNTOF LPAREN identifier_expression RPAREN
@@ -304,7 +267,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_identifier_expression(self, p):
 		"""identifier_expression : IDENTIFIER
@@ -312,7 +274,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_function_argument_list(self, p):
 		"""function_argument_list : empty
@@ -320,7 +281,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_function_argument_list1(self, p):
 		"""function_argument_list1 : expression
@@ -328,7 +288,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_string_expression(self, p):
 		"""string_expression : string_expression1
@@ -336,7 +295,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_string_expression1(self, p):
 		"""string_expression1 : STRINGLIT
@@ -344,19 +302,16 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_resource(self, p):
 		"""resource : RESOURCE res_spec LBRACE resource_body RBRACE"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_res_spec(self, p):
 		"""res_spec : res_type LPAREN expression resource_name_opt resource_attributes RPAREN"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_resource_name_opt(self, p):
 		"""resource_name_opt : empty
@@ -364,7 +319,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_resource_attributes(self, p):
 		"""resource_attributes : expression
@@ -372,33 +326,24 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_resource_attributes_named(self, p):
 		"""resource_attributes_named : empty
 		| resource_attributes_named resource_attribute_named
 		"""
 		
-		p[0] = p[1] + p[2:]
-		return p
+		if len(p) > 2:
+			p[1].append(p[2])
+		
+		p[0] = p[1]
 	
 	def p_resource_attribute_named(self, p):
-		"""resource_attribute_named : COMPRESSED
-		| UNCOMPRESSED
-		| CHANGED
-		| UNCHANGED
-		| PRELOAD
-		| NONPRELOAD
-		| LOCKED
-		| UNLOCKED
-		| PURGEABLE
-		| NONPURGEABLE
-		| SYSHEAP
-		| APPHEAP
-		"""
+		"""resource_attribute_named : RESOURCE_ATTRIBUTE"""
+		
+		if p[1].lower() not in _RESOURCE_ATTRIBUTES:
+			raise parser.ParseError(p.slice[1])
 		
 		p[0] = p[1]
-		return p
 	
 	def p_resource_body(self, p):
 		"""resource_body : empty
@@ -408,7 +353,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_resource_body1(self, p):
 		"""resource_body1 : resource_item
@@ -417,7 +361,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_resource_item(self, p):
 		"""resource_item : value
@@ -425,7 +368,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_data(self, p):
 		"""data : DATA res_spec LBRACE string_expression RBRACE
@@ -433,7 +375,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1:]
-		return p
 	
 	def p_STRINGLIT(self, p):
 		"""STRINGLIT : STRINGLIT_TEXT
@@ -441,7 +382,6 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def p_INTLIT(self, p):
 		"""INTLIT : INTLIT_DEC
@@ -452,13 +392,12 @@ class RezParserRetro68(object):
 		"""
 		
 		p[0] = p[1]
-		return p
 	
 	def __init__(self, lexer=None, **kwargs):
 		super().__init__()
 		
-		self.lexer = lexer.RezLexer().lexer if lexer is None else lexer
-		self.parser = ply.yacc.yacc(module=self, tabmodule="_table_parser_retro68", debugfile="_debug_parser_retro68.out", **kwargs)
+		self.lexer = _default_lexer() if lexer is None else lexer
+		self.parser = parser._build_parser(self, "parser_retro68", **kwargs)
 	
 	def parse(self, inp, **kwargs):
 		return self.parser.parse(inp, self.lexer, **kwargs)
\ No newline at end of file
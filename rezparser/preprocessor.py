@@ -1,4 +1,8 @@
+import collections
+import enum
+import functools
 import os
+import sys
 import typing
 
 from . import common
@@ -15,7 +19,7 @@ __all__ = [
 # NOTE: Rez "preprocessor" directives may look similar to the standard C preprocessor, but there are more advanced cases where the two are very different. The Rez "preprocessor directives" are actually closely integrated with the language, and can't easily be processed without understanding the language semantics. This requires some unusual parsing techniques below, and some very odd corner cases might not be handled correctly.
 # #define macros can only be constants. Macro functions do not exist. Enum constants are implemented as macros (but unlike macros, their values are evaluated when they are defined, not when they are used). Preprocessor directives may be constructed from macros. The identifier directly after the hash symbol is *not* macro-expanded, but may come from a macro expansion that already includes the hash symbol. (Constructing preprocessor directives from macros is not supported by this parser.)
 # #undef exists and does what you expect. It is not an error to re-#define an existing macro without an intermediate #undef, or to #undef nonexistant macros.
-# Recursive macro expansions are not treated specially (unlike in C, where a macro is not expanded when it appears inside its own expansion, even indirectly). Nesting macros more than 100 levels deep is an error, which makes recursive macros completely useless.
+# Recursive macro expansions are not treated specially (unlike in C, where a macro is not expanded when it appears inside its own expansion, even indirectly). Nesting macros more than 100 levels deep is an error, which makes recursive macros completely useless. (This parser reports recursive macros as soon as the recursion is detected, without expanding them 100 times first.)
 # There are four predefined macros: true (1), false (0), rez (1 in Rez, 0 in DeRez), and derez (1 in DeRez, 0 in Rez). These are not keywords (unlike the resource attribute constants). They are normal macros that can be redefined or undefined (although the documentation recommends agianst doing so).
 # Macro names are case-insensitive.
 # There are #if, #ifdef, #ifndef, #elif, #else, #endif. The defined expression (with or without parens) is supported to check whether a macro is defined. Rez "functions" can be used in expressions. An empty expression evaluates to true, but also generates an error, so this is not useful in practice.
@@ -31,6 +35,64 @@ class PreprocessError(common.RezParserError):
 	__slots__ = ()
 
 
+# Macro names are looked up for every identifier token, and the same few names are used over and over again, so their casefolded versions are cached instead of casefolding every occurrence again.
+# The results are also interned, so that macro lookups match the dict keys by identity, even for names that were evicted from the cache in the meantime.
+@functools.lru_cache(maxsize=4096)
+def _casefold(name):
+	return sys.intern(name.casefold())
+
+
+# The types of identifier and keyword tokens are always interned (they come from RezLexer.t_IDENTIFIER and RezLexer.keyword_types, or from common.Token), so the preprocessor compares them by identity against these constants on its hot paths, instead of comparing the full strings for every token.
+_IDENTIFIER = sys.intern("IDENTIFIER")
+_ENUM = sys.intern("ENUM")
+
+# Types of tokens in active blocks that are dropped by the preprocessor.
+_SKIPPED_TYPES = frozenset({"NEWLINE", "PP_EMPTY"})
+
+# Token types that can make up an expression whose value depends only on the tokens themselves (integer literals, parentheses and operators). The values of such expressions are cached, see _eval_expression.
+_CONSTANT_EXPRESSION_TYPES = frozenset({
+	"INTLIT_DEC", "INTLIT_HEX", "INTLIT_OCT", "INTLIT_BIN", "INTLIT_CHAR",
+	"LPAREN", "RPAREN",
+	"PLUS", "MINUS", "MULTIPLY", "DIVIDE", "MODULO",
+	"SHIFTLEFT", "SHIFTRIGHT",
+	"LESS", "GREATER", "LESSEQUAL", "GREATEREQUAL", "EQUAL", "NOTEQUAL",
+	"BITAND", "BITXOR", "BITOR", "BITNOT",
+	"BOOLAND", "BOOLOR", "BOOLNOT",
+})
+
+# Maximum number of constant expression values that a preprocessor keeps, see _eval_expression.
+_EXPRESSION_VALUES_CACHE_SIZE = 4096
+
+# Token types that are accepted as a macro name in a defined expression. Keywords are included, because (unlike in the parser) they have no special meaning there.
+_MACRO_NAME_TYPES = frozenset({_IDENTIFIER}) | lexer.RezLexer.keyword_token_types
+
+
+# Expansions of the predefined macros. Macro expansions are never modified, so these are shared by all preprocessor instances.
+_EXPANSION_0 = (common.Token("INTLIT_DEC", "0"),)
+_EXPANSION_1 = (common.Token("INTLIT_DEC", "1"),)
+
+
+class _IfState(enum.IntEnum):
+	"""The state of a conditional block."""
+	
+	# An active block, whose contents are processed.
+	active = 0
+	# An inactive block in a chain where no active block has been found yet.
+	waiting = 1
+	# A block in a chain where an active block has been found already.
+	done = 2
+	# A block inside an inactive block.
+	outer_inactive = 3
+
+
+# State of the block after an #else (or an #elif in a chain where no condition has to be evaluated), depending on the state of the previous block. _IfState.waiting is not included here, because an #elif in that state has to evaluate its condition first.
+_NEXT_IF_STATES = {
+	_IfState.active: _IfState.done,
+	_IfState.done: _IfState.done,
+	_IfState.outer_inactive: _IfState.outer_inactive,
+}
+
+
 class IncludeState(object):
 	lexer: typing.Any
 	framework: typing.Optional[str]
@@ -75,69 +137,72 @@ class RezPreprocessor(object):
 		
 		self.include_stack = [IncludeState(lexer=lexer, framework=None)]
 		
-		# Mapping of macro names (case-insensitive, all names must be passed through str.casefold) to lists of expansion tokens.
+		# The token method of the lexer of the innermost include state (the last element of include_stack). It is called for every token that doesn't come from a macro expansion, so it is kept here instead of being looked up through the include stack every time. Must be updated with _update_lexer_token whenever include_stack changes.
+		self.lexer_token = lexer.token
+		
+		# Mapping of macro names (case-insensitive, all names must be passed through _casefold) to tuples of expansion tokens.
 		self.macros = {
-			"true": [common.Token("INTLIT_DEC", "1")],
-			"false": [common.Token("INTLIT_DEC", "0")],
-			"rez": [common.Token("INTLIT_DEC", "0" if derez else "1")],
-			"derez": [common.Token("INTLIT_DEC", "1" if derez else "0")],
+			"true": _EXPANSION_1,
+			"false": _EXPANSION_0,
+			"rez": _EXPANSION_0 if derez else _EXPANSION_1,
+			"derez": _EXPANSION_1 if derez else _EXPANSION_0,
 		}
 		if macros is not None:
-			self.macros.update(macros)
+			# The expansion tokens are copied into common.Token objects, whose types are interned like those of the lexer's identifier and keyword tokens, so that the identity checks on token types also work for them.
+			self.macros.update((_casefold(name), tuple(common.Token(tok) for tok in expansion)) for name, expansion in macros.items())
 		
 		# Sequence of directories to search for include files.
 		self.include_path = [] if include_path is None else include_path
 		# Sequence of directories to search for system include files.
 		self.sys_include_path = [] if sys_include_path is None else sys_include_path
 		
+		# Mapping of (name, include path) tuples to the text and framework path of files that were already included. See state_for_include.
+		self._include_file_cache = {}
+		
 		# Callable to use for printing (when a #printf is encountered).
 		if print_func is None:
 			def print_func(arg):
 				pass
 		self.print_func = print_func
 		
-		# Sequence ("reverse stack") of tokens that were produced by a macro expansion and not yet consumed.
-		# Can also contain the string "expansion_end" to mark the end of a macro expansion, these markers are only used internally to track macro expansion depth and are otherwise ignored.
+		# Stack of iterators over the expansions of all macros that are currently being expanded. Tokens are taken from the topmost iterator, and once it is exhausted, it is popped and the expansion below it continues.
 		self.expansion_stack = []
 		
-		# Sequence (stack) of the names of all macros that are currently being expanded. Names are pushed when they are expanded, and popped whenever an "expansion_end" marker is hit. If this stack grows too large, the preprocessor errors out.
+		# Sequence (stack) of the names of all macros that are currently being expanded, in the same order as expansion_stack. If this stack grows too large, the preprocessor errors out.
 		self.macro_stack = []
 		
-		# Sequence (stack) of strings representing the state of all conditional blocks enclosing the current block. Valid values are:
-		# * "waiting": An inactive block in a chain where no active block has been found yet.
-		# * "active": An active block, whose contents are processed.
-		# * "done": A block in a chain where an active block has been found already.
-		# * "outer_inactive": A block inside an inactive block.
+		# Sequence (stack) of _IfState values representing the state of all conditional blocks enclosing the current block.
 		self.if_stack = []
 		
-		# The state of the current conditional block. Values are the same as for if_stack. Top-level code is considered to be in an "active" block.
-		self.if_state = "active"
+		# The _IfState of the current conditional block. Top-level code is considered to be in an active block.
+		self.if_state = _IfState.active
 		
 		# Set of tuples (filename, angle) representing files that were previously used in an #import or #include directive and should not be included again when used as an argument to #import.
 		self.included_files = set()
 		
-		# Current state of the enum declaration mini-parser. Valid values are:
-		# * "inactive": Not inside any enum declaration.
-		# * "enum": After the enum keyword.
-		# * "type_name": After the (optional) enum type name.
-		# * "next": At the start of the next enum constant declaration.
-		# * "name": After the current enum constant name.
-		# * "equals": After the equals sign preceding the explicit enum constant value (both optional).
-		# * "value": After the explicit enum constant value.
-		# * "end": After the closing enum declaration brace.
-		self.enum_state = "inactive"
+		# The _scan_enum generator for the enum declaration that is currently being read, or None if not inside an enum declaration.
+		self.enum_scanner = None
 		
-		# The value of the next enum constant in this declaration.
-		self.enum_counter = 0
+		# The NoOpLexer that is passed to the parser for all expressions parsed by the preprocessor, or None if none was needed yet. See _expr_lexer.
+		self.expr_lexer = None
 		
-		# The name of the current enum constant.
-		self.enum_constant_name = None
+		# Mapping of token sequences (as tuples of type and value) to the values of constant expressions that were already evaluated, in least recently used order. Limited to _EXPRESSION_VALUES_CACHE_SIZE entries. See _eval_expression.
+		self.expression_values = collections.OrderedDict()
 		
-		# The tokens making up the explicit value of the current enum constant, if any.
-		self.enum_constant_tokens = []
-		
-		# The parentesis nesting depth in the explicit value of the current enum constant, if any. (The value is terminated by a comma outside of any parentheses.)
-		self.enum_constant_depth = 0
+		# Mappings of token types to the methods that handle the corresponding directives. Conditional directives are handled in all blocks, all other directives only in active blocks.
+		self.conditional_handlers = {
+			"PP_IF": self._handle_if,
+			"PP_ELIF": self._handle_if,
+			"PP_IFDEF": self._handle_ifdef,
+			"PP_ELSE": self._handle_else,
+			"PP_ENDIF": self._handle_endif,
+		}
+		self.directive_handlers = {
+			"PP_DEFINE": self._handle_define,
+			"PP_UNDEF": self._handle_undef,
+			"PP_INCLUDE": self._handle_include,
+			"PP_PRINTF": self._handle_printf,
+		}
 	
 	def __iter__(self):
 		return iter(self.token, None)
@@ -146,273 +211,387 @@ class RezPreprocessor(object):
 		base = self.include_stack[0]
 		self.include_stack[:] = [IncludeState(lexer=base.lexer.clone(), framework=None)]
 		self.include_stack[-1].lexer.input(*args, **kwargs)
+		self._update_lexer_token()
+		self.enum_scanner = None
 	
-	def _eval_expression(self, tokens):
-		exprlexer = lexer.NoOpLexer()
-		exprlexer.filename = self.include_stack[-1].lexer.filename
-		return self.evaluator.eval(self.parser.parse_expr(tokens, exprlexer))
+	def _update_lexer_token(self):
+		self.lexer_token = self.include_stack[-1].lexer.token
 	
-	def _token_internal(self, *, expand=True):
-		while True:
+	def _expr_lexer(self):
+		# The same lexer (and its token deque) is reused for every expression, instead of creating a new one each time.
+		if self.expr_lexer is None:
+			self.expr_lexer = lexer.NoOpLexer()
+		
+		self.expr_lexer.filename = self.filename
+		self.expr_lexer.lineno = self.lineno
+		return self.expr_lexer
+	
+	def _eval_expression(self, tokens):
+		# After macro expansion, most #if conditions and enum values consist only of literals and operators, and the same ones (such as "1" or "0") come up again and again. The values of these expressions are cached. Expressions containing anything else (such as Rez functions, whose results may change) are always evaluated again.
+		if all(tok.type in _CONSTANT_EXPRESSION_TYPES for tok in tokens):
+			key = tuple((tok.type, tok.value) for tok in tokens)
 			try:
-				tok = self.expansion_stack.pop(0)
-			except IndexError:
-				tok = self.include_stack[-1].lexer.token()
+				value = self.expression_values[key]
+			except KeyError:
+				value = self.expression_values[key] = self.evaluator.eval(self.parser.parse_expr(tokens, self._expr_lexer()))
+				if len(self.expression_values) > _EXPRESSION_VALUES_CACHE_SIZE:
+					self.expression_values.popitem(last=False)
+			else:
+				self.expression_values.move_to_end(key)
 			
-			if tok is None:
-				if len(self.include_stack) > 1:
+			return value
+		
+		return self.evaluator.eval(self.parser.parse_expr(tokens, self._expr_lexer()))
+	
+	def _raw_token(self):
+		# Returns the next token from the current macro expansion or (if no macro is being expanded) from the lexer, without expanding it.
+		expansion_stack = self.expansion_stack
+		
+		while True:
+			if expansion_stack:
+				# Expansions never contain None, so it can be used to detect the end of the expansion without catching StopIteration.
+				tok = next(expansion_stack[-1], None)
+				if tok is None:
+					expansion_stack.pop()
+					self.macro_stack.pop()
+					continue
+			else:
+				tok = self.lexer_token()
+				if tok is None and len(self.include_stack) > 1:
 					self.include_stack.pop()
-				else:
-					return tok
-			elif tok == "expansion_end":
-				self.macro_stack.pop()
-				continue
-			elif tok.type == "IDENTIFIER" and self.if_state in ("active", "waiting") and expand:
-				name = tok.value.casefold()
-				try:
-					if len(self.macro_stack) > 100:
-						raise PreprocessError(f"Maximum macro expansion depth exceeded (> 100), macro stack: {self.macro_stack}", filename=self.filename, lineno=self.lineno)
-					self.expansion_stack[0:0] = self.macros[name] + ["expansion_end"]
-					self.macro_stack.append(name)
-				except KeyError:
+					self._update_lexer_token()
+					continue
+			
+			return tok
+	
+	def _token_internal(self):
+		# Like _raw_token, but expands macros (unless the current block is inactive).
+		# This runs once for every token, so the attributes that are used on every iteration are looked up only once. (These objects are only ever modified in place, never replaced.) For the same reason, the code of _raw_token is repeated here instead of calling it.
+		expansion_stack = self.expansion_stack
+		macros = self.macros
+		macro_stack = self.macro_stack
+		
+		while True:
+			if expansion_stack:
+				tok = next(expansion_stack[-1], None)
+				if tok is None:
+					expansion_stack.pop()
+					macro_stack.pop()
+					continue
+			else:
+				tok = self.lexer_token()
+				if tok is None:
+					if len(self.include_stack) > 1:
+						self.include_stack.pop()
+						self._update_lexer_token()
+						continue
+					else:
+						return tok
+			
+			if tok.type is _IDENTIFIER and self.if_state <= _IfState.waiting:
+				name = _casefold(tok.value)
+				# Most identifiers are not macros, so this is checked with a plain lookup rather than by catching a KeyError.
+				expansion = macros.get(name)
+				if expansion is None:
 					return tok
+				# Many macros (including the predefined ones and all enum constants) expand to a single literal. Such a token can be returned right away, without pushing an expansion that would be exhausted immediately. Single identifiers still go through the expansion stack, because they may be macros themselves.
+				if len(expansion) == 1 and expansion[0].type is not _IDENTIFIER:
+					return expansion[0]
+				# A macro that appears in its own expansion (directly or indirectly) would be expanded again and again until the depth limit below is reached, because macro definitions cannot change in the middle of an expansion. This is detected right away instead of running through all 100 levels first.
+				if name in macro_stack:
+					raise PreprocessError(f"Recursive expansion of macro {name!r}, macro stack: {macro_stack}", filename=self.filename, lineno=self.lineno)
+				if len(macro_stack) > 100:
+					raise PreprocessError(f"Maximum macro expansion depth exceeded (> 100), macro stack: {macro_stack}", filename=self.filename, lineno=self.lineno)
+				expansion_stack.append(iter(expansion))
+				macro_stack.append(name)
 			else:
 				return tok
 	
-	def token(self):
+	def _handle_if(self, tok):
+		if tok.type == "PP_ELIF" and not self.if_stack:
+			raise PreprocessError(f"#elif outside of a conditional block: {tok}", filename=self.filename, lineno=self.lineno)
+		
+		if tok.type == "PP_IF" and self.if_state is not _IfState.active:
+			self.if_stack.append(self.if_state)
+			self.if_state = _IfState.outer_inactive
+			return
+		elif tok.type == "PP_ELIF" and self.if_state is not _IfState.waiting:
+			# The condition doesn't need to be evaluated (the rest of the directive is skipped as part of the now inactive block).
+			self.if_state = _NEXT_IF_STATES[self.if_state]
+			return
+		
+		cond_tokens = []
+		cond_token = self._token_internal()
+		while cond_token.type not in ("NEWLINE", "SEMICOLON"):
+			if cond_token.type == "DEFINED":
+				cond_token = self._raw_token()
+				if cond_token.type == "LPAREN":
+					cond_token = self._raw_token()
+					if cond_token.type in _MACRO_NAME_TYPES:
+						macro = cond_token.value
+					else:
+						raise PreprocessError(f"Expected identifier in defined expression parentheses, not {cond_token}", filename=self.filename, lineno=self.lineno)
+					cond_token = self._raw_token()
+					if cond_token.type != "RPAREN":
+						raise PreprocessError(f"Expected ')' after defined expression identifier, not {cond_token}", filename=self.filename, lineno=self.lineno)
+				elif cond_token.type in _MACRO_NAME_TYPES:
+					macro = cond_token.value
+				else:
+					raise PreprocessError(f"Expected '(' or identifier after defined, not {cond_token}", filename=self.filename, lineno=self.lineno)
+				
+				cond_token = common.Token("INTLIT_DEC", str(int(_casefold(macro) in self.macros)), cond_token.lineno, cond_token.lexpos)
+			
+			cond_tokens.append(cond_token)
+			cond_token = self._token_internal()
+		
+		cond = bool(self._eval_expression(cond_tokens))
+		
+		if tok.type == "PP_IF":
+			self.if_stack.append(self.if_state)
+		self.if_state = _IfState.active if cond else _IfState.waiting
+	
+	def _handle_ifdef(self, tok):
+		cond = (_casefold(tok.pp_ifdef_name) in self.macros) ^ (tok.pp_ifdef_type == "ifndef")
+		self.if_stack.append(self.if_state)
+		if self.if_stack[-1] is not _IfState.active:
+			self.if_state = _IfState.outer_inactive
+		elif cond:
+			self.if_state = _IfState.active
+		else:
+			self.if_state = _IfState.waiting
+	
+	def _handle_else(self, tok):
+		if not self.if_stack:
+			raise PreprocessError(f"#else outside of a conditional block: {tok}", filename=self.filename, lineno=self.lineno)
+		
+		if self.if_state is _IfState.waiting:
+			self.if_state = _IfState.active
+		else:
+			self.if_state = _NEXT_IF_STATES[self.if_state]
+	
+	def _handle_endif(self, tok):
+		if not self.if_stack:
+			raise PreprocessError(f"#endif outside of a conditional block: {tok}", filename=self.filename, lineno=self.lineno)
+		
+		self.if_state = self.if_stack.pop()
+	
+	def _handle_define(self, tok):
+		self.macros[_casefold(tok.pp_define_name)] = tuple(tok.pp_define_value)
+	
+	def _handle_undef(self, tok):
+		self.macros.pop(_casefold(tok.pp_undef_name), None)
+	
+	def _handle_include(self, tok):
+		once = tok.pp_include_type == "import"
+		
+		if isinstance(tok.pp_include_filename, str):
+			angle = True
+			name = tok.pp_include_filename[1:-1]
+		else:
+			angle = False
+			ast = self.parser.parse_expr(tok.pp_include_filename, self._expr_lexer())
+			name = self.evaluator.eval(ast).decode(common.STRING_ENCODING)
+		
+		if not once or (name, angle) not in self.included_files:
+			self.included_files.add((name, angle))
+			self.include_stack.append(self.state_for_include(name, angle=angle))
+			self._update_lexer_token()
+	
+	def _handle_printf(self, tok):
+		printf_tokens = []
+		printf_token = self._token_internal()
+		while printf_token.type not in ("NEWLINE", "SEMICOLON"):
+			printf_tokens.append(printf_token)
+			printf_token = self._token_internal()
+		
+		if not printf_tokens:
+			raise PreprocessError("Missing arguments after #printf", filename=self.filename, lineno=self.lineno)
+		
+		if printf_tokens[0].type != "LPAREN":
+			raise PreprocessError(f"Expected '(' after #printf, not {printf_tokens[0]}", filename=self.filename, lineno=self.lineno)
+		
+		if printf_tokens[-1].type != "RPAREN":
+			raise PreprocessError(f"Expected ')' to terminate #printf argument list, not {printf_tokens[-1]}", filename=self.filename, lineno=self.lineno)
+		
+		# The arguments are sliced out of the token list between the top-level commas, instead of being built up one token at a time.
+		printf_args = []
+		printf_paren_level = 0
+		arg_start = 1
+		for i in range(1, len(printf_tokens) - 1):
+			printf_token_type = printf_tokens[i].type
+			if printf_token_type == "LPAREN":
+				printf_paren_level += 1
+			elif printf_token_type == "RPAREN":
+				printf_paren_level -= 1
+				if printf_paren_level < 0:
+					raise PreprocessError("Unmatched closing paren in #printf argument list", filename=self.filename, lineno=self.lineno)
+			elif printf_token_type == "COMMA" and printf_paren_level == 0:
+				printf_args.append(printf_tokens[arg_start:i])
+				arg_start = i + 1
+		
+		if printf_paren_level > 0:
+			raise PreprocessError("Unmatched opening paren in #printf argument list", filename=self.filename, lineno=self.lineno)
+		
+		printf_args.append(printf_tokens[arg_start:-1])
+		
+		if not printf_args[-1]:
+			del printf_args[-1]
+		
+		if len(printf_args) == 0:
+			raise PreprocessError("#printf got no arguments, expected at least one", filename=self.filename, lineno=self.lineno)
+		elif len(printf_args) > 20:
+			raise PreprocessError(f"#printf got {len(printf_args)} arguments, expected at most 20", filename=self.filename, lineno=self.lineno)
+		
+		printf_parsed_args = [self.parser.parse_expr(arg, self._expr_lexer()) for arg in printf_args]
+		printf_evaled_args = [self.evaluator.eval(ast) for ast in printf_parsed_args]
+		# TODO Enable when Evaluator.eval_format is implemented
+		##out = self.evaluator.eval_format(*printf_evaled_args).decode(common.STRING_ENCODING)
+		out = repr(printf_evaled_args)
+		self.print_func(out)
+	
+	def _scan_enum(self):
+		# Generator that is started after an enum keyword was returned from _active_token. Yields the rest of the enum declaration and defines its constants as macros along the way. Tokens are only read when token() asks for them, so that errors (including those reported by the parser) point at the current token.
+		next_token = self._active_token
+		
+		tok = next_token()
+		if tok is None:
+			return
+		if tok.type is _IDENTIFIER:
+			yield tok
+			tok = next_token()
+			if tok is None:
+				return
+			if tok.type != "LBRACE":
+				raise PreprocessError(f"Expected '{{', not {tok}", filename=self.filename, lineno=self.lineno)
+		elif tok.type != "LBRACE":
+			raise PreprocessError(f"Expected identifier or '{{', not {tok}", filename=self.filename, lineno=self.lineno)
+		yield tok
+		
+		counter = 0
 		while True:
-			tok = self._token_internal()
+			tok = next_token()
+			if tok is None:
+				return
+			if tok.type == "RBRACE":
+				yield tok
+				break
+			elif tok.type is _ENUM:
+				raise PreprocessError(f"Invalid nested enum: {tok}", filename=self.filename, lineno=self.lineno)
+			elif tok.type is not _IDENTIFIER:
+				raise PreprocessError(f"Expected identifier or '{{', not {tok}", filename=self.filename, lineno=self.lineno)
+			yield tok
 			
+			name = _casefold(tok.value)
+			tok = next_token()
 			if tok is None:
-				return None
-			elif tok.type in ("PP_IF", "PP_ELIF"):
-				if tok.type == "PP_ELIF" and not self.if_stack:
-					raise PreprocessError(f"#elif outside of a conditional block: {tok}", filename=self.filename, lineno=self.lineno)
-				
-				if tok.type == "PP_IF" and self.if_state != "active":
-					self.if_stack.append(self.if_state)
-					self.if_state = "outer_inactive"
-					continue
-				elif tok.type == "PP_ELIF" and self.if_state in ("done", "outer_inactive"):
-					continue
-				
-				cond_tokens = []
-				cond_token = self._token_internal()
-				while cond_token.type not in ("NEWLINE", "SEMICOLON"):
-					if cond_token.type == "DEFINED":
-						cond_token = self._token_internal(expand=False)
-						if cond_token.type == "LPAREN":
-							cond_token = self._token_internal(expand=False)
-							if cond_token.type == "IDENTIFIER" or cond_token.type.lower() in lexer.RezLexer.keywords:
-								macro = cond_token.value
-							else:
-								raise PreprocessError(f"Expected identifier in defined expression parentheses, not {cond_token}", filename=self.filename, lineno=self.lineno)
-							cond_token = self._token_internal(expand=False)
-							if cond_token.type != "RPAREN":
-								raise PreprocessError(f"Expected ')' after defined expression identifier, not {cond_token}", filename=self.filename, lineno=self.lineno)
-						elif cond_token.type == "IDENTIFIER" or cond_token.type.lower() in lexer.RezLexer.keywords:
-							macro = cond_token.value
-						else:
-							raise PreprocessError(f"Expected '(' or identifier after defined, not {cond_token}", filename=self.filename, lineno=self.lineno)
-						
-						cond_token = common.Token("INTLIT_DEC", str(int(macro.casefold() in self.macros)), cond_token.lineno, cond_token.lexpos)
-					
-					cond_tokens.append(cond_token)
-					cond_token = self._token_internal()
-				
-				cond = bool(self._eval_expression(cond_tokens))
-				
-				if tok.type == "PP_IF":
-					self.if_stack.append(self.if_state)
-					self.if_state = "active" if cond else "waiting"
-				elif self.if_state == "waiting" and cond:
-					self.if_state = "active"
-			elif tok.type == "PP_IFDEF":
-				cond = (tok.pp_ifdef_name.casefold() in self.macros) ^ (tok.pp_ifdef_type == "ifndef")
-				self.if_stack.append(self.if_state)
-				if self.if_stack[-1] != "active":
-					self.if_state = "outer_inactive"
-				elif cond:
-					self.if_state = "active"
-				else:
-					self.if_state = "waiting"
-			elif tok.type == "PP_ELSE":
-				if not self.if_stack:
-					raise PreprocessError(f"#else outside of a conditional block: {tok}", filename=self.filename, lineno=self.lineno)
-				
-				if self.if_state == "outer_inactive":
-					pass
-				elif self.if_state == "waiting":
-					self.if_state = "active"
-				else:
-					self.if_state = "done"
-			elif tok.type == "PP_ENDIF":
-				if not self.if_stack:
-					raise PreprocessError(f"#endif outside of a conditional block: {tok}", filename=self.filename, lineno=self.lineno)
-				
-				self.if_state = self.if_stack.pop()
-			elif self.if_state != "active" or tok.type in ("NEWLINE", "PP_EMPTY"):
-				continue
-			elif tok.type == "PP_DEFINE":
-				self.macros[tok.pp_define_name.casefold()] = tok.pp_define_value
-			elif tok.type == "PP_UNDEF":
-				self.macros.pop(tok.pp_undef_name.casefold(), None)
-			elif tok.type == "PP_INCLUDE":
-				once = tok.pp_include_type == "import"
-				
-				if isinstance(tok.pp_include_filename, str):
-					angle = True
-					name = tok.pp_include_filename[1:-1]
-				else:
-					angle = False
-					ast = self.parser.parse_expr(tok.pp_include_filename, lexer.NoOpLexer())
-					name = self.evaluator.eval(ast).decode(common.STRING_ENCODING)
-				
-				if not once or (name, angle) not in self.included_files:
-					self.included_files.add((name, angle))
-					self.include_stack.append(self.state_for_include(name, angle=angle))
-			elif tok.type == "PP_PRINTF":
-				printf_tokens = []
-				printf_token = self._token_internal()
-				while printf_token.type not in ("NEWLINE", "SEMICOLON"):
-					printf_tokens.append(printf_token)
-					printf_token = self._token_internal()
-				
-				if not printf_tokens:
-					raise PreprocessError("Missing arguments after #printf", filename=self.filename, lineno=self.lineno)
-				
-				if printf_tokens[0].type != "LPAREN":
-					raise PreprocessError(f"Expected '(' after #printf, not {printf_tokens[0]}", filename=self.filename, lineno=self.lineno)
-				
-				if printf_tokens[-1].type != "RPAREN":
-					raise PreprocessError(f"Expected ')' to terminate #printf argument list, not {printf_tokens[-1]}", filename=self.filename, lineno=self.lineno)
-				
-				printf_args = [[]]
-				printf_paren_level = 0
-				for printf_token in printf_tokens[1:-1]:
-					if printf_token.type == "LPAREN":
-						printf_paren_level += 1
-					elif printf_token.type == "RPAREN":
-						printf_paren_level -= 1
-						if printf_paren_level < 0:
-							raise PreprocessError("Unmatched closing paren in #printf argument list", filename=self.filename, lineno=self.lineno)
-					elif printf_token.type == "COMMA" and printf_paren_level == 0:
-						printf_args.append([])
-					else:
-						printf_args[-1].append(printf_token)
-				
-				if printf_paren_level > 0:
-					raise PreprocessError("Unmatched opening paren in #printf argument list", filename=self.filename, lineno=self.lineno)
-				
-				if not printf_args[-1]:
-					del printf_args[-1]
-				
-				if len(printf_args) == 0:
-					raise PreprocessError("#printf got no arguments, expected at least one", filename=self.filename, lineno=self.lineno)
-				elif len(printf_args) > 20:
-					raise PreprocessError(f"#printf got {len(printf_args)} arguments, expected at most 20", filename=self.filename, lineno=self.lineno)
-				
-				printf_parsed_args = [self.parser.parse_expr(arg, lexer.NoOpLexer()) for arg in printf_args]
-				printf_evaled_args = [self.evaluator.eval(ast) for ast in printf_parsed_args]
-				# TODO Enable when Evaluator.eval_format is implemented
-				##out = self.evaluator.eval_format(*printf_evaled_args).decode(common.STRING_ENCODING)
-				out = repr(printf_evaled_args)
-				self.print_func(out)
-			elif tok.type == "ENUM":
-				if self.enum_state != "inactive":
-					raise PreprocessError(f"Invalid nested enum: {tok}", filename=self.filename, lineno=self.lineno)
-				
-				self.enum_state = "enum"
-				self.enum_counter = 0
-				return tok
-			elif self.enum_state != "inactive":
-				if self.enum_state == "enum":
-					if tok.type == "IDENTIFIER":
-						self.enum_state = "type_name"
-					elif tok.type == "LBRACE":
-						self.enum_state = "next"
-					else:
-						raise PreprocessError(f"Expected identifier or '{{', not {tok}", filename=self.filename, lineno=self.lineno)
-				elif self.enum_state == "type_name":
-					if tok.type == "LBRACE":
-						self.enum_state = "next"
-					else:
-						raise PreprocessError(f"Expected '{{', not {tok}", filename=self.filename, lineno=self.lineno)
-				elif self.enum_state == "next":
-					if tok.type == "IDENTIFIER":
-						self.enum_constant_name = tok.value.casefold()
-						self.enum_state = "name"
-					elif tok.type == "RBRACE":
-						self.enum_state = "end"
-					else:
-						raise PreprocessError(f"Expected identifier or '{{', not {tok}", filename=self.filename, lineno=self.lineno)
-				elif self.enum_state == "name":
-					if tok.type == "ASSIGN":
-						self.enum_state = "equals"
-						self.enum_constant_tokens = []
-						self.enum_constant_depth = 0
-					elif tok.type in ("COMMA", "RBRACE"):
-						self.macros[self.enum_constant_name] = [common.Token("INTLIT_DEC", str(self.enum_counter), self.lineno, tok.lexpos)]
-						if tok.type == "COMMA":
-							self.enum_counter += 1
-							self.enum_state = "next"
-						else:
-							self.enum_state = "end"
-					else:
-						raise PreprocessError(f"Expected '=', ',' or '}}', not {tok}", filename=self.filename, lineno=self.lineno)
-				elif self.enum_state == "equals":
-					if tok.type == "COMMA" and self.enum_constant_depth == 0:
-						self.enum_counter = self._eval_expression(self.enum_constant_tokens)
-						self.macros[self.enum_constant_name] = [common.Token("INTLIT_DEC", str(self.enum_counter), self.lineno, tok.lexpos)]
-						self.enum_counter += 1
-						self.enum_state = "next"
-					else:
-						self.enum_constant_tokens.append(tok)
-						if tok.type in ("LPAREN", "LBRACKET", "LBRACE"):
-							self.enum_constant_depth += 1
-						elif tok.type in ("RPAREN", "RBRACKET", "RBRACE"):
-							self.enum_constant_depth -= 1
-				elif self.enum_state == "value":
-					if tok.type == "COMMA":
-						self.enum_counter += 1
-						self.enum_state = "next"
-					elif tok.type == "RBRACE":
-						self.enum_state = "end"
-					else:
-						raise PreprocessError(f"Expected ',' or '}}', not {tok}", filename=self.filename, lineno=self.lineno)
-				elif self.enum_state == "end":
-					if tok.type == "SEMICOLON":
-						self.enum_state = "inactive"
-						self.enum_counter = 0
-						self.enum_constant_name = None
-						self.enum_constant_tokens = []
-						self.enum_constant_depth = 0
-					else:
-						raise PreprocessError(f"Expected ';', not {tok}", filename=self.filename, lineno=self.lineno)
-				return tok
+				return
+			if tok.type == "ASSIGN":
+				yield tok
+				# The explicit value is terminated by a comma or closing brace outside of any parentheses, brackets or braces.
+				value_tokens = []
+				depth = 0
+				while True:
+					tok = next_token()
+					if tok is None:
+						return
+					if tok.type is _ENUM:
+						raise PreprocessError(f"Invalid nested enum: {tok}", filename=self.filename, lineno=self.lineno)
+					elif tok.type in ("LPAREN", "LBRACKET", "LBRACE"):
+						depth += 1
+					elif tok.type in ("RPAREN", "RBRACKET", "RBRACE"):
+						if depth == 0 and tok.type == "RBRACE":
+							break
+						depth -= 1
+					elif tok.type == "COMMA" and depth == 0:
+						break
+					value_tokens.append(tok)
+					yield tok
+				counter = self._eval_expression(value_tokens)
+			elif tok.type not in ("COMMA", "RBRACE"):
+				raise PreprocessError(f"Expected '=', ',' or '}}', not {tok}", filename=self.filename, lineno=self.lineno)
+			
+			self.macros[name] = (common.Token("INTLIT_DEC", str(counter), self.lineno, tok.lexpos),)
+			counter += 1
+			yield tok
+			if tok.type == "RBRACE":
+				break
+		
+		tok = next_token()
+		if tok is None:
+			return
+		if tok.type != "SEMICOLON":
+			raise PreprocessError(f"Expected ';', not {tok}", filename=self.filename, lineno=self.lineno)
+		yield tok
+	
+	def _skip_inactive(self):
+		# Called while the current block is inactive. Skips all tokens up to the next conditional directive (or the end of the input) and returns it. Macros are not expanded in skipped code, and tokens from the lexer are checked directly, without going through _raw_token.
+		conditional_handlers = self.conditional_handlers
+		while True:
+			if self.expansion_stack:
+				tok = self._raw_token()
 			else:
+				tok = self.lexer_token()
+				if tok is None:
+					# The end of an included file (or of the input) is handled by _raw_token.
+					tok = self._raw_token()
+			
+			if tok is None or tok.type in conditional_handlers:
 				return tok
 	
-	def state_for_include(self, name, *, angle):
-		# By default, search only the system include path.
-		include_path = self.sys_include_path
-		
-		# For each header in the include stack that comes from a framework, also search the corresponding local sub-frameworks.
-		for state in self.include_stack:
-			if state.framework is not None:
-				include_path.insert(0, os.path.join(state.framework, "Frameworks"))
+	def _active_token(self):
+		# Returns the next token from an active block that isn't a preprocessor directive or newline. All directives are processed along the way.
+		token_internal = self._token_internal
+		conditional_handlers = self.conditional_handlers
+		directive_handlers = self.directive_handlers
 		
-		# If the include is quoted and not angled, also search the local include path.
-		if not angle:
-			include_path[0:0] = self.include_path
-		
-		framework = None
+		while True:
+			if self.if_state is _IfState.active:
+				tok = token_internal()
+			else:
+				tok = self._skip_inactive()
+			
+			if tok is None:
+				return None
+			
+			tok_type = tok.type
+			
+			# Conditional directives are handled even in inactive blocks, because they change which block is active.
+			# Most tokens are not directives, so the handlers are looked up with get instead of catching a KeyError.
+			handler = conditional_handlers.get(tok_type)
+			if handler is not None:
+				handler(tok)
+				continue
+			
+			# Only tokens from active blocks get this far (see _skip_inactive).
+			if tok_type in _SKIPPED_TYPES:
+				continue
+			
+			handler = directive_handlers.get(tok_type)
+			if handler is not None:
+				handler(tok)
+				continue
+			
+			return tok
+	
+	def token(self):
+		enum_scanner = self.enum_scanner
+		if enum_scanner is not None:
+			tok = next(enum_scanner, None)
+			if tok is not None:
+				return tok
+			self.enum_scanner = None
 		
+		tok = self._active_token()
+		if tok is not None and tok.type is _ENUM:
+			self.enum_scanner = self._scan_enum()
+		return tok
+	
+	def _read_include(self, name, include_path):
+		# Returns the text of the file name found on include_path, and the path of the framework that it comes from (or None if it isn't from a framework). Raises FileNotFoundError if the file doesn't exist in any of the directories.
 		for dir in include_path:
 			try:
 				with open(os.path.join(dir, name), "r", encoding=common.STRING_ENCODING) as f:
-					text = f.read()
-				break
+					return f.read(), None
 			except FileNotFoundError:
 				pass
 			
@@ -422,13 +601,34 @@ class RezPreprocessor(object):
 				parts = (parts[0] + ".framework", "Headers") + parts[1:]
 				try:
 					with open(os.path.join(dir, *parts), "r", encoding=common.STRING_ENCODING) as f:
-						text = f.read()
-					framework = os.path.join(dir, parts[0])
-					break
+						return f.read(), os.path.join(dir, parts[0])
 				except FileNotFoundError:
 					pass
-		else:
-			raise PreprocessError(f"File {name!r} (angle = {angle}) not found on include path", filename=self.filename, lineno=self.lineno)
+		
+		raise FileNotFoundError(name)
+	
+	def state_for_include(self, name, *, angle):
+		# By default, search only the system include path. (This is a copy, so that the additional directories below are not added to self.sys_include_path.)
+		include_path = list(self.sys_include_path)
+		
+		# For each header in the include stack that comes from a framework, also search the corresponding local sub-frameworks.
+		for state in self.include_stack:
+			if state.framework is not None:
+				include_path.insert(0, os.path.join(state.framework, "Frameworks"))
+		
+		# If the include is quoted and not angled, also search the local include path.
+		if not angle:
+			include_path[0:0] = self.include_path
+		
+		# The same headers are often included many times (for example by several other headers), so the files that were found and their contents are cached for the lifetime of this preprocessor, instead of searching the include path and reading the file again.
+		key = (name, tuple(include_path))
+		try:
+			text, framework = self._include_file_cache[key]
+		except KeyError:
+			try:
+				text, framework = self._include_file_cache[key] = self._read_include(name, include_path)
+			except FileNotFoundError:
+				raise PreprocessError(f"File {name!r} (angle = {angle}) not found on include path", filename=self.filename, lineno=self.lineno) from None
 		
 		sublexer = self.include_stack[-1].lexer.clone()
 		sublexer.input(text)
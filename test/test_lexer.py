@@ -0,0 +1,39 @@
+import sys
+import unittest
+
+import rezparser.lexer
+
+
+class TestStringLiterals(unittest.TestCase):
+	def test_text_literal_value_is_source_text(self):
+		lexer = rezparser.lexer.RezLexer()
+		lexer.input('"abc"\n')
+		tok = lexer.token()
+		self.assertEqual(tok.type, "STRINGLIT_TEXT")
+		self.assertEqual(tok.value, '"abc"')
+		self.assertFalse(tok.stringlit_escapes)
+	
+	def test_text_literal_with_escapes(self):
+		lexer = rezparser.lexer.RezLexer()
+		lexer.input('"a\\tb"\n')
+		tok = lexer.token()
+		self.assertEqual(tok.value, '"a\\tb"')
+		self.assertTrue(tok.stringlit_escapes)
+	
+	def test_unencodable_text_literal_in_inactive_block(self):
+		lexer = rezparser.lexer.RezLexer()
+		lexer.input('#if 0\n"中"\n#endif\n')
+		self.assertEqual([tok.type for tok in lexer], ["PP_IF", "INTLIT_DEC", "NEWLINE", "STRINGLIT_TEXT", "NEWLINE", "PP_ENDIF", "NEWLINE"])
+
+
+class TestTokenTypes(unittest.TestCase):
+	def test_identifier_and_keyword_types_interned(self):
+		# The preprocessor compares these types by identity.
+		lexer = rezparser.lexer.RezLexer()
+		lexer.input("foo enum Hex cstring")
+		for tok, token_type in zip(lexer, ["IDENTIFIER", "ENUM", "SIMPLE_FIELD_MODIFIER", "STRING_TYPE_NAME"]):
+			self.assertIs(tok.type, sys.intern(token_type))
+
+
+if __name__ == "__main__":
+	unittest.main()
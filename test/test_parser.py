@@ -0,0 +1,270 @@
+import os
+import random
+import tempfile
+import unittest
+import unittest.mock
+
+import ply.yacc
+
+import rezparser.ast
+import rezparser.common
+import rezparser.eval
+import rezparser.lexer
+import rezparser.parser
+import rezparser.preprocessor
+
+
+class ParserTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.parser = rezparser.parser.RezParser()
+	
+	def parse_expr(self, text):
+		return self.parser.parse_expr(text, rezparser.lexer.RezLexer())
+	
+	def preprocessor(self, text, filename="<input>"):
+		preprocessor = rezparser.preprocessor.RezPreprocessor(rezparser.lexer.RezLexer(filename=filename), parser=self.parser, evaluator=rezparser.eval.Evaluator())
+		preprocessor.input(text)
+		return preprocessor
+	
+	def parse_file(self, text):
+		return self.parser.parse_file(None, self.preprocessor(text))
+
+
+class TestStringLiterals(ParserTestCase):
+	def test_text_literal(self):
+		self.assertEqual(self.parse_expr('"abc"').value, b"abc")
+	
+	def test_text_literal_with_escapes(self):
+		self.assertEqual(self.parse_expr('"a\\tb\\0x41"').value, b"a\tbA")
+	
+	def test_unencodable_text_literal(self):
+		with self.assertRaises(rezparser.parser.ParseError) as cm:
+			self.parse_expr('"中"')
+		self.assertEqual(cm.exception.filename, "<input>")
+		self.assertEqual(cm.exception.lineno, 1)
+
+
+class TestParseFileStatements(ParserTestCase):
+	def test_statements_in_order(self):
+		statements = []
+		result = self.parser.parse_file_statements(None, self.preprocessor("data 'A' (1) {};\ndata 'B' (2) {};\ndata 'C' (3) {};\n"), statements.append)
+		self.assertEqual(result.statements, [])
+		self.assertEqual([statement.spec.id.value for statement in statements], [1, 2, 3])
+	
+	def test_parse_error(self):
+		statements = []
+		with self.assertRaises(rezparser.parser.ParseError) as cm:
+			self.parser.parse_file_statements(None, self.preprocessor("data 'A' (1) {};\ndata 'B' (2) {};\ndata 'C' (3) { ) };\ndata 'D' (4) {};\n", filename="test.r"), statements.append)
+		self.assertEqual(cm.exception.filename, "test.r")
+		self.assertEqual(cm.exception.lineno, 3)
+		self.assertEqual([statement.spec.id.value for statement in statements], [1, 2])
+		self.assertIsNone(self.parser.statement_callback)
+
+
+class TestParseErrors(ParserTestCase):
+	def test_unexpected_end_of_expression(self):
+		lexer = rezparser.lexer.RezLexer(filename="expr.r")
+		with self.assertRaises(rezparser.parser.ParseError) as cm:
+			self.parser.parse_expr("1 +", lexer)
+		self.assertEqual(cm.exception.filename, "expr.r")
+		self.assertEqual(cm.exception.lineno, 1)
+		self.assertEqual(cm.exception.message, "Unexpected end of input")
+
+
+class TestStartLexer(ParserTestCase):
+	def test_reused(self):
+		start_lexer = self.parser.start_lexer
+		self.parse_expr("1 + 2")
+		self.assertIs(self.parser.start_lexer, start_lexer)
+		self.assertIsNone(start_lexer.lexer)
+	
+	def test_nested_parse(self):
+		# The preprocessor parses the #if conditions with the same parser that is reading the file. Rez functions are not handled by _IntExpressionReader, so this condition goes through the grammar.
+		start_lexer = self.parser.start_lexer
+		(data,) = self.parse_file("#if $$Year > 1900\ndata 'A' (1) {};\n#endif\n").statements
+		self.assertEqual(data.spec.id.value, 1)
+		self.assertIsNotNone(self.parser.start_lexer)
+		self.assertIs(self.parser.start_lexer, start_lexer)
+
+
+class TestSharedTables(unittest.TestCase):
+	def test_separate_instances(self):
+		first = rezparser.parser.RezParser()
+		second = rezparser.parser.RezParser()
+		self.assertIsNot(second.parser, first.parser)
+		self.assertIs(second.parser.action, first.parser.action)
+		self.assertIs(second.parser.goto, first.parser.goto)
+		self.assertEqual(second.parser.errorfunc, second.p_error)
+		
+		# Grammar actions are bound to their own instance, so each parser calls its own statement callback.
+		preprocessor = rezparser.preprocessor.RezPreprocessor(rezparser.lexer.RezLexer(), parser=second, evaluator=rezparser.eval.Evaluator())
+		preprocessor.input("data 'A' (1) {};\n")
+		statements = []
+		first.statement_callback = self.fail
+		second.parse_file_statements(None, preprocessor, statements.append)
+		self.assertEqual(len(statements), 1)
+
+
+class TestSymbolicConstants(ParserTestCase):
+	def test_all_constants_kept(self):
+		(type_statement,) = self.parse_file("type 'TEST' { hex string dead = $\"dead\", beef = $\"beef\"; };\n").statements
+		(field,) = type_statement.fields
+		self.assertEqual([constant.name for constant in field.symbolic_constants], ["dead", "beef"])
+		self.assertEqual([constant.value.value for constant in field.symbolic_constants], [b"\xde\xad", b"\xbe\xef"])
+
+
+class TestIntExpressions(ParserTestCase):
+	def test_parenthesized_expression(self):
+		expr = self.parse_expr("(1 + 2) * 3")
+		self.assertIsInstance(expr, rezparser.ast.Multiply)
+		self.assertIsInstance(expr.left, rezparser.ast.Add)
+
+
+class TestIntExpressionReader(ParserTestCase):
+	"""Check that the fast path for token lists produces the same ASTs as the full grammar."""
+	
+	def tokens(self, text):
+		lexer = rezparser.lexer.RezLexer()
+		lexer.input(text)
+		return list(lexer)
+	
+	def assertSameAsGrammar(self, text):
+		expected = repr(self.parse_expr(text))
+		self.assertEqual(repr(self.parser.parse_expr(self.tokens(text), rezparser.lexer.NoOpLexer())), expected, text)
+	
+	def assertReaderSupported(self, text):
+		self.assertEqual(repr(rezparser.parser._IntExpressionReader(self.tokens(text)).read()), repr(self.parse_expr(text)), text)
+	
+	def assertReaderUnsupported(self, text):
+		with self.assertRaises(rezparser.parser._UnsupportedExpression, msg=text):
+			rezparser.parser._IntExpressionReader(self.tokens(text)).read()
+		self.assertSameAsGrammar(text)
+	
+	def test_precedence(self):
+		for text in ["1 + 2 * 3", "1 * 2 + 3", "1 | 2 ^ 3 & 4", "1 << 2 + 3", "1 < 2 == 3 > 4", "1 || 2 && 3", "1 == 2 != 3 <= 4"]:
+			self.assertReaderSupported(text)
+	
+	def test_associativity(self):
+		for text in ["1 - 2 - 3", "8 / 4 / 2", "1 << 2 << 3", "1 && 2 && 3", "1 % 2 * 3"]:
+			self.assertReaderSupported(text)
+	
+	def test_unary(self):
+		for text in ["-1", "!x", "~$FF", "- -1", "-1 * 2", "!x || ~y", "-(1 + 2)"]:
+			self.assertReaderSupported(text)
+	
+	def test_parentheses(self):
+		for text in ["(1 + 2) * 3", "1 - (2 - 3)", "((x))", "(1 << 2) + (3 | 4)"]:
+			self.assertReaderSupported(text)
+	
+	def test_fallback(self):
+		for text in ["$$byte(3)", "y[1, 2]", "1 + $$countof(x)", '"abc" "def"']:
+			self.assertReaderUnsupported(text)
+	
+	def test_syntax_errors_not_handled(self):
+		for text in ["1 +", "(1 + 2", "1 2", ")"]:
+			with self.assertRaises(rezparser.parser._UnsupportedExpression, msg=text):
+				rezparser.parser._IntExpressionReader(self.tokens(text)).read()
+	
+	def test_random_expressions(self):
+		rng = random.Random(1)
+		binary_operators = ["*", "/", "%", "+", "-", "<<", ">>", "<", ">", "<=", ">=", "==", "!=", "&", "^", "|", "&&", "||"]
+		
+		def generate(depth):
+			r = rng.random()
+			if depth <= 0 or r < 0.2:
+				return rng.choice(["1", "x", "$10", "0x1F", "'ab'", "$$id", "y[1, 2]", "$$byte(3)"])
+			elif r < 0.35:
+				return rng.choice(["-", "!", "~"]) + generate(depth - 1)
+			elif r < 0.45:
+				return "(" + generate(depth - 1) + ")"
+			else:
+				return generate(depth - 1) + " " + rng.choice(binary_operators) + " " + generate(depth - 1)
+		
+		for _ in range(500):
+			self.assertSameAsGrammar(generate(5))
+
+
+class TestExprMemoization(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.parser = rezparser.parser.RezParser(memoize=True)
+	
+	def setUp(self):
+		self.parser.expr_cache.clear()
+	
+	def test_disabled_by_default(self):
+		self.assertIsNone(rezparser.parser.RezParser().expr_cache)
+		self.assertIsNone(rezparser.parser.RezParser(memoize=False).expr_cache)
+	
+	def test_cache_hit(self):
+		first = self.parser.parse_expr("1 + 2 * x", rezparser.lexer.RezLexer())
+		second = self.parser.parse_expr("1 + 2 * x", rezparser.lexer.RezLexer())
+		self.assertIs(second, first)
+		self.assertEqual(repr(second), "Add(left=IntLiteral(value=1), right=Multiply(left=IntLiteral(value=2), right=IntSymbol(name='x')))")
+		self.assertEqual(list(self.parser.expr_cache), ["1 + 2 * x"])
+	
+	def test_token_cache_hit(self):
+		lexer = rezparser.lexer.RezLexer()
+		lexer.input("(1 + 2) * 3")
+		tokens = list(lexer)
+		first = self.parser.parse_expr(tokens, rezparser.lexer.NoOpLexer())
+		second = self.parser.parse_expr(tokens, rezparser.lexer.NoOpLexer())
+		self.assertIs(second, first)
+		self.assertEqual(len(self.parser.expr_cache), 1)
+	
+	def test_bounded(self):
+		# Single-token expressions are cheap to parse, so that the cache can be filled quickly.
+		size = rezparser.parser._EXPR_CACHE_SIZE
+		for i in range(size + 10):
+			self.parser.parse_expr([rezparser.common.Token("INTLIT_DEC", str(i))], rezparser.lexer.NoOpLexer())
+		self.assertEqual(len(self.parser.expr_cache), size)
+		# The least recently used entries are evicted first.
+		self.assertNotIn((("INTLIT_DEC", "9"),), self.parser.expr_cache)
+		self.assertIn((("INTLIT_DEC", "10"),), self.parser.expr_cache)
+		self.assertIn((("INTLIT_DEC", str(size + 9)),), self.parser.expr_cache)
+	
+	def test_hit_moves_to_end(self):
+		self.parser.parse_expr("1", rezparser.lexer.RezLexer())
+		self.parser.parse_expr("2", rezparser.lexer.RezLexer())
+		self.parser.parse_expr("1", rezparser.lexer.RezLexer())
+		self.assertEqual(list(self.parser.expr_cache), ["2", "1"])
+
+class TestTableCache(unittest.TestCase):
+	# A custom errorlog keeps the parser from reusing the tables that were already built in this process.
+	
+	def test_not_written_by_default(self):
+		with tempfile.TemporaryDirectory() as cache_home, unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": cache_home, "HOME": cache_home}):
+			os.environ.pop("REZPARSER_TABLE_CACHE_DIR", None)
+			rezparser.parser.RezParser(errorlog=ply.yacc.NullLogger())
+			self.assertEqual(os.listdir(cache_home), [])
+	
+	def test_written_to_requested_dir(self):
+		with tempfile.TemporaryDirectory() as cache_dir:
+			rezparser.parser.RezParser(table_cache_dir=cache_dir, errorlog=ply.yacc.NullLogger())
+			self.assertEqual(os.listdir(cache_dir), ["_table_parser.pickle"])
+	
+	def test_corrupt_pickle(self):
+		with tempfile.TemporaryDirectory() as cache_dir:
+			path = os.path.join(cache_dir, "_table_parser.pickle")
+			with open(path, "wb") as f:
+				f.write(b"not a pickle")
+			
+			parser = rezparser.parser.RezParser(table_cache_dir=cache_dir, errorlog=ply.yacc.NullLogger())
+			self.assertEqual(repr(parser.parse_expr("1 + 2", rezparser.lexer.RezLexer())), "Add(left=IntLiteral(value=1), right=IntLiteral(value=2))")
+			# The broken file is replaced with the newly generated tables.
+			self.assertTrue(rezparser.parser._check_table_cache(path))
+			self.assertGreater(os.path.getsize(path), len(b"not a pickle"))
+	
+	def test_truncated_pickle(self):
+		with tempfile.TemporaryDirectory() as cache_dir:
+			rezparser.parser.RezParser(table_cache_dir=cache_dir, errorlog=ply.yacc.NullLogger())
+			path = os.path.join(cache_dir, "_table_parser.pickle")
+			with open(path, "rb+") as f:
+				f.truncate(os.path.getsize(path) // 2)
+			
+			parser = rezparser.parser.RezParser(table_cache_dir=cache_dir, errorlog=ply.yacc.NullLogger())
+			self.assertEqual(repr(parser.parse_expr("1 + 2", rezparser.lexer.RezLexer())), "Add(left=IntLiteral(value=1), right=IntLiteral(value=2))")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+import rezparser.parser
+import rezparser.parser_retro68
+
+
+class ParserRetro68TestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.parser = rezparser.parser_retro68.RezParserRetro68()
+
+
+class TestKeywordGroups(ParserRetro68TestCase):
+	def test_string_types(self):
+		for keyword in ["string", "pstring", "wstring"]:
+			self.parser.parse(f"type 'TEST' {{ {keyword}; }};")
+	
+	def test_cstring_rejected(self):
+		with self.assertRaises(rezparser.parser.ParseError):
+			self.parser.parse("type 'TEST' { cstring; };")
+	
+	def test_resource_attributes(self):
+		self.parser.parse("resource 'TEST' (128 sysheap locked purgeable) { };")
+	
+	def test_protected_rejected(self):
+		for keyword in ["protected", "unprotected"]:
+			with self.assertRaises(rezparser.parser.ParseError, msg=keyword):
+				self.parser.parse(f"resource 'TEST' (128 {keyword}) {{ }};")
+
+
+class TestExpressions(ParserRetro68TestCase):
+	def test_bitwise_complement(self):
+		(resource,) = self.parser.parse("resource 'TEST' (128) { ~1 + 2 };")
+		self.assertEqual(resource[3], [[[[["~", ["1"]], "+", ["2"]]]]])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,216 @@
+import os
+import tempfile
+import unittest
+
+import ply.lex
+
+import rezparser.common
+import rezparser.eval
+import rezparser.lexer
+import rezparser.parser
+import rezparser.preprocessor
+
+
+class PreprocessorTestCase(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.parser = rezparser.parser.RezParser()
+	
+	def setUp(self):
+		self.printed = []
+		self.preprocessor = rezparser.preprocessor.RezPreprocessor(rezparser.lexer.RezLexer(), parser=self.parser, evaluator=rezparser.eval.Evaluator(), print_func=self.printed.append)
+	
+	def preprocess(self, text):
+		"""Preprocess text and return the types and values of the resulting tokens."""
+		
+		self.preprocessor.input(text)
+		return [(tok.type, tok.value) for tok in self.preprocessor]
+	
+	def macro_values(self, name):
+		return [tok.value for tok in self.preprocessor.macros[name]]
+
+
+class TestMacros(PreprocessorTestCase):
+	def lex_token(self, type, value):
+		tok = ply.lex.LexToken()
+		tok.type = type
+		tok.value = value
+		tok.lineno = 1
+		tok.lexpos = 0
+		return tok
+	
+	def test_passed_macros(self):
+		# Token types built at runtime are not interned.
+		macros = {
+			"Inner": [self.lex_token("".join(["IDENTI", "FIER"]), "Value")],
+			"Value": [self.lex_token("INTLIT_DEC", "5")],
+			"MakeEnum": [self.lex_token("".join(["EN", "UM"]), "enum")],
+		}
+		self.preprocessor = rezparser.preprocessor.RezPreprocessor(rezparser.lexer.RezLexer(), parser=self.parser, evaluator=rezparser.eval.Evaluator(), macros=macros)
+		# The expansion of Inner is an identifier, which is expanded again.
+		self.assertEqual(self.preprocess("Inner\n"), [("INTLIT_DEC", "5")])
+		# The expansion of MakeEnum starts an enum declaration.
+		self.preprocess("MakeEnum { A = Inner };\n")
+		self.assertEqual(self.macro_values("a"), ["5"])
+	
+	def test_passed_lex_tokens(self):
+		lexer = rezparser.lexer.RezLexer()
+		lexer.input("Other")
+		self.preprocessor = rezparser.preprocessor.RezPreprocessor(rezparser.lexer.RezLexer(), parser=self.parser, evaluator=rezparser.eval.Evaluator(), macros={"Name": list(lexer), "Other": [rezparser.common.Token("INTLIT_DEC", "1")]})
+		self.assertEqual(self.preprocess("Name\n"), [("INTLIT_DEC", "1")])
+	
+	def test_recursive_expansion(self):
+		with self.assertRaisesRegex(rezparser.preprocessor.PreprocessError, "Recursive expansion of macro 'a'"):
+			self.preprocess("#define A B\n#define B A\nA\n")
+	
+	def chain(self, depth):
+		"""Return source code defining depth macros that expand to each other in a chain, followed by a use of the first one.
+		The last macro expands to more than one token, so that its expansion is nested as well.
+		"""
+		
+		defines = "".join(f"#define M{i} M{i + 1}\n" for i in range(depth - 1))
+		return f"{defines}#define M{depth - 1} (1)\nM0\n"
+	
+	def test_maximum_expansion_depth(self):
+		self.assertEqual(self.preprocess(self.chain(101)), [("LPAREN", "("), ("INTLIT_DEC", "1"), ("RPAREN", ")")])
+		with self.assertRaisesRegex(rezparser.preprocessor.PreprocessError, "Maximum macro expansion depth exceeded"):
+			self.preprocess(self.chain(102))
+
+
+class TestEnum(PreprocessorTestCase):
+	def test_implicit_values(self):
+		self.preprocess("enum { A, B, C };\n")
+		self.assertEqual(self.macro_values("a"), ["0"])
+		self.assertEqual(self.macro_values("b"), ["1"])
+		self.assertEqual(self.macro_values("c"), ["2"])
+	
+	def test_explicit_value_on_last_constant(self):
+		tokens = self.preprocess("enum { A = 1 };\nenum { B };\n")
+		self.assertEqual(tokens, [
+			("ENUM", "enum"), ("LBRACE", "{"), ("IDENTIFIER", "A"), ("ASSIGN", "="), ("INTLIT_DEC", "1"), ("RBRACE", "}"), ("SEMICOLON", ";"),
+			("ENUM", "enum"), ("LBRACE", "{"), ("IDENTIFIER", "B"), ("RBRACE", "}"), ("SEMICOLON", ";"),
+		])
+		self.assertEqual(self.macro_values("a"), ["1"])
+		self.assertEqual(self.macro_values("b"), ["0"])
+	
+	def test_directives_in_body(self):
+		tokens = self.preprocess('enum {\nA,\n#printf("%d", A)\n#if 1\nB = 5,\n#else\nC,\n#endif\nD\n};\n')
+		self.assertEqual(tokens, [
+			("ENUM", "enum"), ("LBRACE", "{"), ("IDENTIFIER", "A"), ("COMMA", ","),
+			("IDENTIFIER", "B"), ("ASSIGN", "="), ("INTLIT_DEC", "5"), ("COMMA", ","),
+			("IDENTIFIER", "D"), ("RBRACE", "}"), ("SEMICOLON", ";"),
+		])
+		self.assertEqual(self.printed, ["[b'%d', 0]"])
+		self.assertEqual(self.macro_values("b"), ["5"])
+		self.assertEqual(self.macro_values("d"), ["6"])
+		self.assertNotIn("c", self.preprocessor.macros)
+	
+	def test_unterminated(self):
+		# The tokens read so far are passed on, so that the parser reports the error.
+		tokens = self.preprocess("enum { A = 1, B")
+		self.assertEqual(tokens, [("ENUM", "enum"), ("LBRACE", "{"), ("IDENTIFIER", "A"), ("ASSIGN", "="), ("INTLIT_DEC", "1"), ("COMMA", ","), ("IDENTIFIER", "B")])
+		self.assertEqual(self.macro_values("a"), ["1"])
+		self.assertNotIn("b", self.preprocessor.macros)
+	
+	def test_unterminated_parse_error(self):
+		self.preprocessor = rezparser.preprocessor.RezPreprocessor(rezparser.lexer.RezLexer(filename="enum.r"), parser=self.parser, evaluator=rezparser.eval.Evaluator())
+		self.preprocessor.input("enum {\nA = 1,\nB")
+		with self.assertRaises(rezparser.parser.ParseError) as cm:
+			self.parser.parse_file(None, self.preprocessor)
+		self.assertEqual(cm.exception.filename, "enum.r")
+		self.assertEqual(cm.exception.lineno, 3)
+	
+	def test_read_incrementally(self):
+		# The enum body is only read as the parser asks for it, so the preceding statement is passed to the callback before the #printf runs.
+		events = []
+		self.preprocessor = rezparser.preprocessor.RezPreprocessor(rezparser.lexer.RezLexer(), parser=self.parser, evaluator=rezparser.eval.Evaluator(), print_func=events.append)
+		self.preprocessor.input('type \'TEST\' { };\nenum {\nA,\n#printf("%d", A)\nB\n};\n')
+		self.parser.parse_file_statements(None, self.preprocessor, lambda statement: events.append(type(statement).__name__))
+		self.assertEqual(events, ["Type", "[b'%d', 0]", "Enum"])
+
+
+class TestConditionals(PreprocessorTestCase):
+	def test_elif_after_active_branch(self):
+		self.assertEqual(self.preprocess("#if 1\nA\n#elif 1\nB\n#else\nC\n#endif\n"), [("IDENTIFIER", "A")])
+	
+	def test_elif_after_inactive_branch(self):
+		self.assertEqual(self.preprocess("#if 0\nA\n#elif 0\nB\n#elif 1\nC\n#elif 1\nD\n#else\nE\n#endif\n"), [("IDENTIFIER", "C")])
+	
+	def test_else_after_inactive_branches(self):
+		self.assertEqual(self.preprocess("#if 0\nA\n#elif 0\nB\n#else\nC\n#endif\n"), [("IDENTIFIER", "C")])
+	
+	def test_nested_in_inactive_block(self):
+		self.assertEqual(self.preprocess("#if 0\n#if 1\nA\n#elif 1\nB\n#else\nC\n#endif\n#endif\n"), [])
+	
+	def test_nested_in_active_block(self):
+		self.assertEqual(self.preprocess("#if 1\nA\n#if 0\nB\n#else\nC\n#endif\nD\n#else\nE\n#endif\nF\n"), [("IDENTIFIER", "A"), ("IDENTIFIER", "C"), ("IDENTIFIER", "D"), ("IDENTIFIER", "F")])
+	
+	def test_ifdef(self):
+		self.assertEqual(self.preprocess("#define X 1\n#ifdef X\nA\n#else\nB\n#endif\n#ifndef X\nC\n#else\nD\n#endif\n"), [("IDENTIFIER", "A"), ("IDENTIFIER", "D")])
+		self.assertEqual(self.preprocess("#ifdef Undefined\nA\n#elif 1\nB\n#endif\n"), [("IDENTIFIER", "B")])
+	
+	def test_ifdef_in_inactive_block(self):
+		self.assertEqual(self.preprocess("#if 0\n#ifdef true\nA\n#else\nB\n#endif\n#else\nC\n#endif\n"), [("IDENTIFIER", "C")])
+	
+	def test_inactive_directives(self):
+		# Directives and macros in inactive blocks are neither processed nor expanded.
+		self.assertEqual(self.preprocess('#if 0\n#define X 1\n#printf("%d", 1)\n#endif\n#ifdef X\nA\n#endif\n'), [])
+		self.assertEqual(self.printed, [])
+	
+	def test_state_restored_after_endif(self):
+		self.preprocess("#if 1\n#if 0\n#endif\n#elif 1\n#endif\n")
+		self.assertEqual(self.preprocessor.if_stack, [])
+		self.assertIs(self.preprocessor.if_state, rezparser.preprocessor._IfState.active)
+	
+	def test_outside_of_conditional_block(self):
+		for text in ["#elif 1\n", "#else\n", "#endif\n", "#if 1\n#endif\n#endif\n"]:
+			with self.assertRaises(rezparser.preprocessor.PreprocessError, msg=text):
+				self.preprocess(text)
+
+
+class TestInclude(PreprocessorTestCase):
+	def setUp(self):
+		super().setUp()
+		tempdir = tempfile.TemporaryDirectory()
+		self.addCleanup(tempdir.cleanup)
+		self.dir = tempdir.name
+	
+	def write(self, name, text):
+		path = os.path.join(self.dir, name)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, "w") as f:
+			f.write(text)
+		return path
+	
+	def test_include_path_unchanged(self):
+		self.write("Outer.framework/Headers/Outer.r", "#include <Inner.r>\n")
+		self.write("Inner.r", "A\n")
+		sys_include_path = [self.dir]
+		self.preprocessor = rezparser.preprocessor.RezPreprocessor(rezparser.lexer.RezLexer(), parser=self.parser, evaluator=rezparser.eval.Evaluator(), sys_include_path=sys_include_path)
+		self.assertEqual(self.preprocess("#include <Outer/Outer.r>\n"), [("IDENTIFIER", "A")])
+		# The include of Inner.r also searched the sub-frameworks of Outer.framework, but only on a copy of the path.
+		self.assertIs(self.preprocessor.sys_include_path, sys_include_path)
+		self.assertEqual(sys_include_path, [self.dir])
+	
+	def test_cached_file(self):
+		path = self.write("Header.r", "A\n")
+		self.preprocessor.sys_include_path.append(self.dir)
+		self.assertEqual(self.preprocess("#include <Header.r>\n"), [("IDENTIFIER", "A")])
+		# The second include is served from the cache, without reading the file again.
+		os.remove(path)
+		self.assertEqual(self.preprocess("#include <Header.r>\n"), [("IDENTIFIER", "A")])
+		self.assertEqual(len(self.preprocessor._include_file_cache), 1)
+
+
+class TestPrintf(PreprocessorTestCase):
+	def test_arguments(self):
+		self.preprocess('#printf("%d %d", 1, 2)\n')
+		self.assertEqual(self.printed, ["[b'%d %d', 1, 2]"])
+	
+	def test_parenthesized_argument(self):
+		self.preprocess('#printf("%d", (1+2)*3)\n')
+		self.assertEqual(self.printed, ["[b'%d', 9]"])
+
+
+if __name__ == "__main__":
+	unittest.main()